@@ -0,0 +1,123 @@
+## Charts
+#
+# Bar charts drawn directly as SVG, for placing in the report inside an
+# fo:instream-foreign-object.  FOP renders them as vector graphics, so they stay sharp at
+# any zoom, and no plotting package has to be loaded to draw them.  The look follows the
+# matplotlib charts the report used to embed as PNG files.
+#
+# As elsewhere in the report the elements are named with their prefix ('svg:rect'), and
+# the chart's own element declares the prefix.
+#
+#	svg = Charts.barChart('Findings by ASD STIG', 'Findings', [ 'CAT I', 'CAT II', 'CAT III' ],
+#						  [ 12, 40, 7 ], [ 'red', 'orange', 'yellow' ])
+#	Charts.write(svg, 'chart.svg')
+import math
+import xml.etree.ElementTree as ET
+
+SVG_NAMESPACE = "http://www.w3.org/2000/svg"
+FONT = "Helvetica, Arial, sans-serif"
+
+## niceStep
+#
+# A round step (1, 2, 2.5 or 5 times a power of ten) dividing 0..maximum into about
+# 'ticks' intervals
+def niceStep(maximum, ticks = 6) :
+	if maximum <= 0 :
+		return 1
+	raw = maximum / ticks
+	power = 10 ** math.floor(math.log10(raw))
+	for factor in [ 1, 2, 2.5, 5, 10 ] :
+		if raw <= factor * power :
+			return factor * power
+	return 10 * power
+
+## label
+#
+# Text for an axis value, without a trailing '.0'
+def label(value) :
+	if value == int(value) :
+		return str(int(value))
+	return str(value)
+
+## text
+#
+# Add a text element
+def text(parent, x, y, content, size, anchor = 'middle', transform = None) :
+	elem = ET.SubElement(parent, 'svg:text')
+	elem.attrib['x'] = label(x)
+	elem.attrib['y'] = label(y)
+	elem.attrib['font-family'] = FONT
+	elem.attrib['font-size'] = label(size)
+	elem.attrib['text-anchor'] = anchor
+	if transform is not None :
+		elem.attrib['transform'] = transform
+	elem.text = content
+	return elem
+
+## barChart
+#
+# Draw a vertical bar chart, one bar per label, and return its 'svg:svg' element.  The
+# value axis starts at zero and is marked in round steps.
+def barChart(title, ylabel, labels, values, colors, width = 640, height = 480) :
+
+	svg = ET.Element('svg:svg')
+	svg.attrib['xmlns:svg'] = SVG_NAMESPACE
+	svg.attrib['width'] = str(width)
+	svg.attrib['height'] = str(height)
+	svg.attrib['viewBox'] = "0 0 " + str(width) + " " + str(height)
+
+	# the plot area, in the proportions matplotlib uses
+	left = width * 0.125
+	right = width * 0.9
+	top = height * 0.12
+	bottom = height * 0.89
+	plot_width = right - left
+	plot_height = bottom - top
+
+	# value axis.  The top is the first step at or above the largest bar
+	step = niceStep(max(values + [ 0 ]))
+	top_value = step * max(1, math.ceil(max(values + [ 0 ]) / step))
+	scale = plot_height / top_value
+
+	background = ET.SubElement(svg, 'svg:rect')
+	background.attrib.update({ 'x' : '0', 'y' : '0', 'width' : str(width), 'height' : str(height), 'fill' : 'white' })
+
+	# bars are 80% of their slot, centred on it
+	slot = plot_width / max(1, len(values))
+	for index, value in enumerate(values) :
+		bar = ET.SubElement(svg, 'svg:rect')
+		bar.attrib['x'] = label(round(left + slot * (index + 0.1), 2))
+		bar.attrib['y'] = label(round(bottom - value * scale, 2))
+		bar.attrib['width'] = label(round(slot * 0.8, 2))
+		bar.attrib['height'] = label(round(value * scale, 2))
+		bar.attrib['fill'] = colors[index % len(colors)]
+
+		centre = round(left + slot * (index + 0.5), 2)
+		tick = ET.SubElement(svg, 'svg:line')
+		tick.attrib.update({ 'x1' : label(centre), 'y1' : label(round(bottom, 2)), 'x2' : label(centre), 'y2' : label(round(bottom + 4, 2)), 'stroke' : 'black' })
+		text(svg, centre, round(bottom + 18, 2), labels[index], 12)
+
+	value = 0
+	while value <= top_value :
+		y = round(bottom - value * scale, 2)
+		tick = ET.SubElement(svg, 'svg:line')
+		tick.attrib.update({ 'x1' : label(round(left - 4, 2)), 'y1' : label(y), 'x2' : label(round(left, 2)), 'y2' : label(y), 'stroke' : 'black' })
+		text(svg, round(left - 7, 2), round(y + 4, 2), label(value), 12, anchor = 'end')
+		value += step
+
+	# frame, axis title and chart title
+	frame = ET.SubElement(svg, 'svg:rect')
+	frame.attrib.update({ 'x' : label(round(left, 2)), 'y' : label(round(top, 2)), 'width' : label(round(plot_width, 2)), 'height' : label(round(plot_height, 2)),
+						  'fill' : 'none', 'stroke' : 'black' })
+	middle = round(top + plot_height / 2, 2)
+	text(svg, round(left - 48, 2), middle, ylabel, 12, transform = "rotate(-90 " + label(round(left - 48, 2)) + " " + label(middle) + ")")
+	text(svg, round(left + plot_width / 2, 2), round(top - 10, 2), title, 14)
+
+	return svg
+
+## write
+#
+# Write a chart to its own SVG file
+def write(svg, filename) :
+	with open(filename, 'wb') as f :
+		ET.ElementTree(svg).write(f, encoding = 'utf-8', xml_declaration = True)
@@ -3,7 +3,11 @@
 #
 import re
 import json
-import matplotlib.pyplot as plt
+import threading
+import Charts
+
+# pyplot is not thread safe.  Held while a chart is drawn with matplotlib
+chartLock = threading.Lock()
 
 ## Collect and Format Executive Summary
 #
@@ -60,20 +64,45 @@ def CollectExecutiveSummary(ini, cdx, project_id) :
 	
 ## Format the Executive Summary Graphic
 #
+# The chart of findings by CAT level.  With the 'svg' backend (the default) the chart is
+# returned as an SVG element to be placed in the report itself.  With 'matplotlib' it is
+# saved as a picture to 'graphic_filename' and None is returned.
 #
-def FormatExecutiveGraphic(summary, graphic_filename) :
+# matplotlib is only loaded when it is used.  Each chart is drawn on a figure of its own,
+# which is closed once saved, so charts for several projects in one run do not pile up
+# on each other.  pyplot keeps global state, so only one chart is drawn at a time.
+def FormatExecutiveGraphic(summary, graphic_filename, backend = 'svg') :
 	
 	# create the data sets we need
 	objects = ( 'CAT I', 'CAT II', 'CAT III' )
 	colors = ( 'red', 'orange', 'yellow' )
 	y_pos = [ 0, 1, 2 ]
 	values = [ summary['cat1Totals'], summary['cat2Totals'], summary['cat3Totals'] ]
+	
+	if backend == 'svg' :
+		return Charts.barChart('Findings by ASD STIG', 'Findings', list(objects), values, list(colors))
+	if backend != 'matplotlib' :
+		print("|-- [FormatExecutiveGraphic] ERROR: unknown chart_backend \"" + backend + "\", use svg or matplotlib")
+		raise ValueError("unknown chart backend")
+	
+	# matplotlib is an optional package, only needed here
+	try :
+		import matplotlib
+	except ImportError :
+		print("|-- [FormatExecutiveGraphic] ERROR: chart_backend = matplotlib needs the matplotlib package (pip install matplotlib)")
+		raise ValueError("matplotlib not installed")
+	matplotlib.use('Agg')
+	import matplotlib.pyplot as plt
 
 	# form the output plot, and ship it to the correct file
-	plt.bar(y_pos, values, align='center', alpha=1.0, color=colors)
-	plt.ylabel('Findings')
-	plt.xticks(y_pos, objects)
-	plt.title('Findings by ASD STIG')
-	plt.savefig(graphic_filename)
-	
-	
\ No newline at end of file
+	with chartLock :
+		figure = plt.figure()
+		try :
+			plt.bar(y_pos, values, align='center', alpha=1.0, color=colors)
+			plt.ylabel('Findings')
+			plt.xticks(y_pos, objects)
+			plt.title('Findings by ASD STIG')
+			plt.savefig(graphic_filename)
+		finally :
+			plt.close(figure)
+	return None
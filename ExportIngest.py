@@ -0,0 +1,287 @@
+## Export Ingestion
+#
+# Fill the report's 'summary_data' from a Code Dx report export (the file of a
+# /report/csv or /report/xml job, run with the STIG standard included) instead of
+# querying the API STIG by STIG.  Only used with --from-export.  The file is read a row (or a finding element) at a time, so only
+# the findings themselves are held, as they are when collecting from the server.
+#
+# Each row gives a finding's ID, status, tool, rule, file and line, and its DISA STIG
+# mappings.  A STIG mapping looks like 'APSC-DV-000460 (CAT I) description', several to
+# a cell separated by 'separator'; the CAT may come from its own column instead.  Rows
+# for the same ID (one per tool result) are merged into one finding.  Closed findings
+# (fixed, mitigated, ...) are left out, as the findings queries leave them out.
+#
+# The names of the columns, or the paths within a finding element ('@id',
+# 'tool/@name'), are set in the '[Export]' section of the configuration.  An export holds
+# no source code or language metrics, so the findings have no code snippets and the
+# language summary is empty.
+import csv
+import os
+import re
+import sys
+import xml.etree.ElementTree as ET
+import FindingRecord
+import FindingsAndTools
+
+# statuses the findings queries filter out
+CLOSED = [ 'fixed', 'mitigated', 'ignored', 'false-positive', 'gone' ]
+
+CAT_NUMBERS = { 'I' : 'cat1', 'II' : 'cat2', 'III' : 'cat3', '1' : 'cat1', '2' : 'cat2', '3' : 'cat3' }
+CAT_PATTERN = re.compile(r'\(?\s*CAT(?:EGORY)?\s*(III|II|I|3|2|1)\s*\)?', re.IGNORECASE)
+
+# where each field is found.  A CSV 'stig' column matches the first column starting with
+# the name ('DISA STIG' finds 'DISA STIG 4.10'), which also gives the STIG version
+DEFAULTS = { 'csv' : { 'id'     : 'ID',
+					   'status' : 'Status',
+					   'tool'   : 'Tool',
+					   'rule'   : 'Rule',
+					   'path'   : 'Path',
+					   'line'   : 'Line',
+					   'stig'   : 'DISA STIG',
+					   'cat'    : '' },
+			 'xml' : { 'finding' : 'finding',
+					   'id'      : '@id',
+					   'status'  : '@status',
+					   'tool'    : 'tool/@name',
+					   'rule'    : 'tool/@code',
+					   'path'    : 'location/@path',
+					   'line'    : 'location/line/@start',
+					   'stig'    : 'standards/standard',
+					   'cat'     : '' } }
+
+## exportFormat
+#
+# 'csv' or 'xml', as configured or from the file's extension.  check reports any other
+# configured format.
+def exportFormat(ini, filename) :
+	format = ini.get('Export', 'format', fallback = 'auto').lower()
+	if format == 'auto' :
+		format = 'xml' if filename.lower().endswith('.xml') else 'csv'
+	return format
+
+## check
+#
+# Make sure an export can be read before any report is started.  Returns a message
+# saying what is wrong, or None.  Missing optional columns are only warned about.
+def check(ini, filename) :
+
+	if not os.path.isfile(filename) :
+		return "export \"" + filename + "\" does not exist"
+	format = exportFormat(ini, filename)
+	if not format in DEFAULTS :
+		return "unknown export format \"" + format + "\"; use csv or xml"
+	fields = { key : ini.get('Export', key, fallback = default) for key, default in DEFAULTS[format].items() }
+
+	if format == 'csv' :
+		try :
+			with open(filename, 'r', newline = '', encoding = 'utf-8-sig') as f :
+				names = [ name.strip() for name in next(csv.reader(f), []) ]
+		except (OSError, UnicodeDecodeError, csv.Error) as e :
+			return "export \"" + filename + "\" could not be read: " + str(e)
+		if not fields['id'] in names :
+			return "export \"" + filename + "\" has no \"" + fields['id'] + "\" column.  Columns are: " + ", ".join(names)
+		if fields['stig'] == '' or not any([ name.startswith(fields['stig']) for name in names ]) :
+			return ("export \"" + filename + "\" has no \"" + fields['stig'] + "\" column of DISA STIG mappings.  Export the report "
+					"with the STIG standard included, or set 'stig' in [Export].  Columns are: " + ", ".join(names))
+		for key in [ 'status', 'tool', 'rule', 'path', 'line', 'cat' ] :
+			if fields[key] != '' and not fields[key] in names :
+				print("|- WARNING: export has no \"" + fields[key] + "\" column; the " + key + " of each finding is left blank")
+		return None
+
+	# an XML export must hold at least one finding element
+	try :
+		with open(filename, 'rb') as f :
+			for event, elem in ET.iterparse(f) :
+				if elem.tag.rsplit('}', 1)[-1] == fields['finding'] :
+					return None
+	except ET.ParseError as e :
+		return "export \"" + filename + "\" is not well formed XML: " + str(e)
+	return "export \"" + filename + "\" has no <" + fields['finding'] + "> elements"
+
+## splitValues
+#
+# The values of a field, split at the separator, without blanks
+def splitValues(values, separator) :
+	retval = []
+	for value in values :
+		for part in value.split(separator) if separator != '' else [ value ] :
+			part = part.strip()
+			if part != '' :
+				retval.append(part)
+	return retval
+
+## csvRows
+#
+# The fields of each row of a CSV export, as lists of values.  Returns the STIG column
+# found and the row iterator.
+def csvRows(f, fields) :
+	reader = csv.DictReader(f)
+	names = reader.fieldnames or []
+
+	stig_column = next(( name for name in names if fields['stig'] != '' and name.strip().startswith(fields['stig']) ), None)
+	if stig_column is None :
+		print("|- ERROR: the export has no \"" + fields['stig'] + "\" column.  Columns are: " + ", ".join(names))
+		raise ValueError("no STIG column in export")
+	columns = dict(fields)
+	columns['stig'] = stig_column
+
+	def rows() :
+		for row in reader :
+			yield { key : [ row[column] ] if row.get(column) is not None else [] for key, column in columns.items() }
+	return stig_column, rows()
+
+## elementValues
+#
+# The values at a path within an element: attribute values for '.../@name', otherwise
+# the text of the matching elements
+def elementValues(elem, path) :
+	if path == '' :
+		return []
+	if '@' in path :
+		where, attribute = path.rsplit('@', 1)
+		where = where.rstrip('/')
+		found = [ elem ] if where in [ '', '.' ] else elem.findall(where)
+		return [ e.get(attribute) for e in found if e.get(attribute) is not None ]
+	return [ e.text or '' for e in elem.findall(path) ]
+
+## xmlRows
+#
+# The fields of each finding element of an XML export.  Each finding is dropped from the
+# tree once read, so the document is never held whole.
+def xmlRows(f, fields) :
+	tag = fields['finding']
+	path = []
+	for event, elem in ET.iterparse(f, events = ( 'start', 'end' )) :
+		if event == 'start' :
+			path.append(elem)
+			continue
+		path.pop()
+		if elem.tag.rsplit('}', 1)[-1] != tag :
+			continue
+		yield { key : elementValues(elem, where) for key, where in fields.items() if key != 'finding' }
+		if len(path) > 0 :
+			path[-1].remove(elem)
+		elem.clear()
+
+## stigMappings
+#
+# The ( cat, STIG name, description ) of each STIG a row maps to.  The CAT column, when
+# there is one, applies to every STIG of the row.
+def stigMappings(row, separator) :
+	row_cat = None
+	for value in row['cat'] :
+		match = CAT_PATTERN.search(value) or re.fullmatch(r'\s*(III|II|I|3|2|1)\s*', value)
+		if match is not None :
+			row_cat = CAT_NUMBERS[match.group(1).upper()]
+
+	retval = []
+	for item in splitValues(row['stig'], separator) :
+		name = item.split()[0]
+		rest = item[len(name) :]
+		cat = row_cat
+		match = CAT_PATTERN.search(rest)
+		if match is not None :
+			cat = cat or CAT_NUMBERS[match.group(1).upper()]
+			rest = rest[: match.start()] + rest[match.end() :]
+		retval.append(( cat, name, rest.strip(' -:') ))
+	return retval
+
+## load
+#
+# Read an export into the 'summary_data' layout of FindingsAndTools.get.  The export
+# should have passed check first.
+def load(ini, filename) :
+
+	format = exportFormat(ini, filename)
+	problem = check(ini, filename)
+	if problem is not None :
+		print("|- ERROR: " + problem)
+		raise ValueError("unreadable export")
+	fields = { key : ini.get('Export', key, fallback = default) for key, default in DEFAULTS[format].items() }
+	separator = ini.get('Export', 'separator', fallback = ';')
+	print("|- Reading " + format.upper() + " export \"" + filename + "\"")
+
+	store = FindingRecord.FindingStore()
+	retval = { 'stig' : { 'name' : '', 'version' : '', 'countBy' : '' }, 'findings' : store,
+			   'cat1' : {}, 'cat2' : {}, 'cat3' : {}, 'tools' : {}, 'pipelined' : False }
+
+	rows_read = 0
+	closed = 0
+	unmapped = 0
+	if format == 'csv' :
+		f = open(filename, 'r', newline = '', encoding = 'utf-8-sig')
+	else :
+		f = open(filename, 'rb')
+	with f :
+		if format == 'csv' :
+			stig_column, rows = csvRows(f, fields)
+			versions = re.findall(r'[0-9]+\.[0-9]+', stig_column)
+		else :
+			stig_column, rows = 'DISA STIG', xmlRows(f, fields)
+			versions = []
+
+		for row in rows :
+			rows_read += 1
+			if len(row['id']) == 0 or row['id'][0].strip() == '' :
+				continue
+			if len(row['status']) > 0 and row['status'][0].strip().lower().replace(' ', '-') in CLOSED :
+				closed += 1
+				continue
+
+			mappings = [ mapping for mapping in stigMappings(row, separator) if mapping[0] is not None ]
+			if len(mappings) == 0 :
+				unmapped += 1
+				continue
+
+			id = row['id'][0].strip()
+			if id.isdigit() :
+				id = int(id)
+			if id in store :
+				finding = store[id]
+			else :
+				path = row['path'][0].strip() if len(row['path']) > 0 else ''
+				line = row['line'][0].strip() if len(row['line']) > 0 else ''
+				if line.isdigit() :
+					line = int(line)
+				where = store.location(path, '', line) if path != '' else FindingRecord.NO_LOCATION
+				rule = row['rule'][0].strip() if len(row['rule']) > 0 else ''
+				finding = FindingRecord.Finding(id, sys.intern(rule), where, [])
+				store.keep(finding)
+
+			# one result per tool, however many rows name it
+			for name in splitValues(row['tool'], separator) :
+				if not name in [ tool.name for tool in finding.tools ] :
+					finding.tools.append(FindingRecord.ToolResult(sys.intern(name), FindingRecord.NO_METADATA))
+
+			for cat, name, description in mappings :
+				stig = retval[cat].get(name)
+				if stig is None :
+					stig = { 'name' : name, 'filter_id' : 'export:' + name, 'description' : description, 'fcount' : 0, 'findings' : [] }
+					retval[cat][name] = stig
+				stig['findings'].append(id)
+
+	# a finding is listed once per STIG, however many of its rows named the STIG, and
+	# the STIGs are listed by name
+	for cat in [ 'cat1', 'cat2', 'cat3' ] :
+		for stig in retval[cat].values() :
+			stig['findings'] = list(dict.fromkeys(stig['findings']))
+			stig['fcount'] = len(stig['findings'])
+		retval[cat] = dict(sorted(retval[cat].items()))
+
+	version = ini.get('Export', 'stig_version', fallback = versions[0] if len(versions) > 0 else '')
+	retval['stig']['name'] = stig_column.strip() if len(versions) > 0 else ('DISA STIG ' + version).strip()
+	retval['stig']['version'] = version
+	print("|- [ExportIngest.load] -- " + str(rows_read) + " rows, " + str(len(store)) + " open findings mapped to a STIG, "
+		  + str(closed) + " closed and " + str(unmapped) + " with no STIG CAT skipped")
+
+	# count as FindingsAndTools.get does
+	total_findings = 0
+	for name in [ 'cat1', 'cat2', 'cat3' ] :
+		retval[name + 'Totals'] = FindingsAndTools.tallyFindings(retval[name])
+		retval[name + 'Unique'] = store.uniqueCount(retval[name])
+		total_findings += FindingsAndTools.processToolCounts(retval[name], retval['tools'], store)
+	retval['toolsFindings'] = total_findings
+
+	# no language metrics in an export
+	retval['codeMetrics'] = [ { 'data' : {} } ]
+	return retval
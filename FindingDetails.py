@@ -3,11 +3,32 @@
 #
 #
 import sys
+import collections
+import concurrent.futures
+import multiprocessing
+import shutil
+import tempfile
+import threading
 import xml.etree.ElementTree as ET
 
+# findings formatted per task when the details are rendered by several processes
+FRAGMENT_FINDINGS = 200
+
+CAT_NAMES = { 'cat1' : 'CAT I', 'cat2' : 'CAT II', 'cat3' : 'CAT III' }
+
+# fragments submitted to the rendering processes and not yet written, per process.
+# Only this many are held in memory (pickled findings going out, FO coming back) at once
+FRAGMENTS_IN_FLIGHT = 4
+
+# the pools of rendering processes, by number of processes.  Each is started by the first
+# report that asks for that many and shared by every report of the run asking the same
+renderPools = {}
+renderPoolLock = threading.Lock()
+
 ## Process details for STIG finding
 #
-#
+# The full details are written for the first STIG a finding appears in.  That first table
+# carries the anchor 'finding-<id>' the later references link to.
 def processTableData(parent, find) :
 
 	# create the top table line
@@ -20,7 +41,7 @@ def processTableData(parent, find) :
 	cell_attr = { 'border-width' : 'thin', 'border-style' : 'solid' }
 				   
 	# create the header line
-	ta = ET.SubElement(parent, 'fo:table', block_attr)
+	ta = ET.SubElement(parent, 'fo:table', dict(block_attr, id = findingAnchor(find)))
 	ET.SubElement(ta, 'fo:table-column', { 'column-width' : '10%' })
 	ET.SubElement(ta, 'fo:table-column', { 'column-width' : '45%' })
 	ET.SubElement(ta, 'fo:table-column', { 'column-width' : '45%' })
@@ -38,11 +59,11 @@ def processTableData(parent, find) :
 	# Add finding data to the next row
 	tr = ET.SubElement(tb, 'fo:table-row')
 	tc = ET.SubElement(tr, 'fo:table-cell', { 'border-width' : 'thin', 'border-style' : 'solid' })
-	ET.SubElement(tc, 'fo:block').text = str(find['id'])
+	ET.SubElement(tc, 'fo:block').text = str(find.id)
 	tc = ET.SubElement(tr, 'fo:table-cell', cell_attr)
-	ET.SubElement(tc, 'fo:block').text = find['location']['path'] + ':' + str(find['location']['line'])
+	ET.SubElement(tc, 'fo:block').text = find.location.path + ':' + str(find.location.line)
 	tc = ET.SubElement(tr, 'fo:table-cell', cell_attr)
-	ET.SubElement(tc, 'fo:block').text = find['error']
+	ET.SubElement(tc, 'fo:block').text = find.error
 	
 	# Begin the table for the tools loop
 	ta = ET.SubElement(parent, 'fo:table', block_attr)
@@ -58,14 +79,14 @@ def processTableData(parent, find) :
 	ET.SubElement(tc, 'fo:block').text = 'Vendor ID (when available)'
 	
 	# loop in the tools
-	for tool in find['tools'] :
+	for tool in find.tools :
 		tr = ET.SubElement(tb, 'fo:table-row')
 		tc = ET.SubElement(tr, 'fo:table-cell', cell_attr)
-		ET.SubElement(tc, 'fo:block').text = tool['name']		
+		ET.SubElement(tc, 'fo:block').text = tool.name		
 		tc = ET.SubElement(tr, 'fo:table-cell', cell_attr)
 		md_key = ''
 		md_val = ''
-		for md_key, md_val in tool['metadata'].items() :
+		for md_key, md_val in tool.metadata.items() :
 			pass
 		ET.SubElement(tc, 'fo:block').text = str(md_key) + " : " + str(md_val)
 		
@@ -91,7 +112,7 @@ def processTableData(parent, find) :
 				  'font-size' : '8',
 				  'text-align' : 'left',
 				  'space-after' : '15pt' }
-	ET.SubElement(tc, 'fo:block', code_attr).text = find['code']
+	ET.SubElement(tc, 'fo:block', code_attr).text = find.code
 	
 	# per Mai's request... Status Block and Comments
 	block_attr['space-after'] = '15pt'
@@ -113,40 +134,276 @@ def processTableData(parent, find) :
 	tc = ET.SubElement(tr, 'fo:table-cell', cell_attr)
 	ET.SubElement(tc, 'fo:block', { 'text-align' : 'left', 'padding-top' : '36pt' }).text = ' '
 	
+## findingAnchor
+#
+# The FO id of the full details of a finding
+def findingAnchor(find) :
+	return 'finding-' + str(find.id)
 
-	
-## Process each STIG item
+## Process a repeated finding
 #
-# Format the header for each STIG, then loop in the findings details
-def processStig(parent, cat_name, cat) :
+# A finding already detailed under an earlier STIG gets its ID, location and error type,
+# with the ID linked to the full details
+def processReference(parent, find, first_stig) :
+
+	block_attr = { 'font-size' : '8',
+				   'border-width' : 'thin',
+				   'text-align' : 'center',
+				   'table-layout' : 'fixed',
+				   'border-collapse' : 'collapse',
+				   'space-after' : '15pt' }
+				   
+	cell_attr = { 'border-width' : 'thin', 'border-style' : 'solid' }
+	
+	ta = ET.SubElement(parent, 'fo:table', block_attr)
+	ET.SubElement(ta, 'fo:table-column', { 'column-width' : '10%' })
+	ET.SubElement(ta, 'fo:table-column', { 'column-width' : '45%' })
+	ET.SubElement(ta, 'fo:table-column', { 'column-width' : '45%' })
+	tb = ET.SubElement(ta, 'fo:table-body')
+	
+	tr = ET.SubElement(tb, 'fo:table-row', { 'background-color' : 'LightSkyBlue' })
+	tc = ET.SubElement(tr, 'fo:table-cell', cell_attr)
+	ET.SubElement(tc, 'fo:block').text = 'ID'
+	tc = ET.SubElement(tr, 'fo:table-cell', cell_attr)
+	ET.SubElement(tc, 'fo:block').text = 'Location'
+	tc = ET.SubElement(tr, 'fo:table-cell', cell_attr)
+	ET.SubElement(tc, 'fo:block').text = 'Error Type'
 	
-	# loop over all of the STIGs in this CAT
-	for stig_name, stig in cat.items() :
+	tr = ET.SubElement(tb, 'fo:table-row')
+	tc = ET.SubElement(tr, 'fo:table-cell', cell_attr)
+	bl = ET.SubElement(tc, 'fo:block')
+	ET.SubElement(bl, 'fo:basic-link', { 'internal-destination' : findingAnchor(find), 'color' : 'blue' }).text = str(find.id)
+	tc = ET.SubElement(tr, 'fo:table-cell', cell_attr)
+	ET.SubElement(tc, 'fo:block').text = find.location.path + ':' + str(find.location.line)
+	tc = ET.SubElement(tr, 'fo:table-cell', cell_attr)
+	ET.SubElement(tc, 'fo:block').text = find.error
 	
-		# process the header that looks nice to describe the current STIG.  The block
-		# has so many elements, I split it out for easy maintenance
-		block_attr = { 'id'					 : stig_name,
-					   'space-before'		 : '15pt',
-					   'font-size'			 : '12pt',
-					   'font-family'		 : 'sans-serif',
-					   'space-after'		 : '15pt',
-					   'color'				 : 'white',
-					   'background-color'	 : 'LightSkyBlue',
-					   'text-align'      	 : 'justify',
-					   'padding-top'		 : '3pt' }
-		bl = ET.SubElement(parent, 'fo:block', block_attr)
-		bl.text = "STIG " + stig_name + " - " + cat_name + " " + stig['description']
+	# point the reader at the full details
+	tr = ET.SubElement(tb, 'fo:table-row')
+	span_attr = { 'border-width' : 'thin', 'border-style' : 'solid', 'number-columns-spanned' : '3' }
+	tc = ET.SubElement(tr, 'fo:table-cell', span_attr)
+	bl = ET.SubElement(tc, 'fo:block', { 'text-align' : 'left' })
+	bl.text = 'Reported in full under STIG ' + first_stig + '.  See the '
+	link = ET.SubElement(bl, 'fo:basic-link', { 'internal-destination' : findingAnchor(find), 'color' : 'blue' })
+	link.text = 'full details'
+	link.tail = ' for tools, code and status.'
+
+## STIG header
+#
+# Process the header that looks nice to describe the current STIG.  The block has so
+# many elements, I split it out for easy maintenance.  Its id is the STIG name, which
+# the table of contents links to.
+def processStigHeader(parent, cat_name, stig_name, stig) :
+
+	block_attr = { 'id'					 : stig_name,
+				   'space-before'		 : '15pt',
+				   'font-size'			 : '12pt',
+				   'font-family'		 : 'sans-serif',
+				   'space-after'		 : '15pt',
+				   'color'				 : 'white',
+				   'background-color'	 : 'LightSkyBlue',
+				   'text-align'      	 : 'justify',
+				   'padding-top'		 : '3pt' }
+	bl = ET.SubElement(parent, 'fo:block', block_attr)
+	bl.text = "STIG " + stig_name + " - " + cat_name + " " + stig['description']
+
+## Process one finding
+#
+# Full details, or a reference when 'first_stig' names the STIG it was detailed under
+def processFinding(parent, find, first_stig) :
+	if first_stig is None :
+		processTableData(parent, find)
+	else :
+		processReference(parent, find, first_stig)
+
+## Plan the details
+#
+# Walk all of the cats (there are three) and their STIGs in report order, yielding
+#
+#	( cat name, STIG name, STIG, [ ( finding ID, first STIG ) ... ] )
+#
+# where 'first STIG' is None when the finding is to be detailed there, or the name of the
+# STIG it was detailed under earlier.  Deciding this up front lets the STIGs be formatted
+# in any order, or in parallel, with the same result.
+def planDetails(summary) :
+
+	rendered = {}
+	for cat in [ 'cat1', 'cat2', 'cat3' ] :
+		for stig_name, stig in summary[cat].items() :
+			yield CAT_NAMES[cat], stig_name, stig, planStig(rendered, stig_name, stig)
+
+## Plan one STIG
+#
+# The ( finding ID, first STIG ) entries of a STIG.  'rendered' maps each finding planned
+# so far to the STIG it is detailed under, and is updated.  STIGs must be planned in
+# report order.
+def planStig(rendered, stig_name, stig) :
+	entries = []
+	for id in stig['findings'] :
+		entries.append(( id, rendered.get(id) ))
+		rendered.setdefault(id, stig_name)
+	return entries
+
+## Process all of the CATs
+#
+# Format the header for each STIG, then loop in the findings details.  This is a
+# generator.  It yields each time a STIG header, or a finding, has been added to the
+# parent, so the caller may write the new elements out and clear them.
+def processCats(parent, summary) :
+
+	store = summary['findings']
+	for cat_name, stig_name, stig, entries in planDetails(summary) :
+		processStigHeader(parent, cat_name, stig_name, stig)
+		yield
 		
-		# now loop and process all of the actual findings
-		for find in stig['findings'] :
-			processTableData(parent, find)
-					   
+		# now loop and process all of the actual findings.  Each is detailed once
+		for id, first_stig in entries :
+			processFinding(parent, store[id], first_stig)
+			yield
+
+## Render a fragment
+#
+# The unit of work for the rendering processes: an optional STIG header, and a run of
+# that STIG's findings as ( finding, first STIG ).  Returns the serialized FO.
+def renderFragment(task) :
+
+	header, entries = task
+	holder = ET.Element('fragment')
+	if header is not None :
+		processStigHeader(holder, *header)
+	for find, first_stig in entries :
+		processFinding(holder, find, first_stig)
+	return ''.join([ ET.tostring(elem, encoding = 'unicode') for elem in holder ])
+
+## Fragment tasks
+#
+# Split the details into renderFragment tasks, in report order.  Large STIGs are cut
+# into runs of 'chunk' findings so the work spreads evenly across the processes.
+def fragmentTasks(summary, chunk) :
+
+	store = summary['findings']
+	for cat_name, stig_name, stig, entries in planDetails(summary) :
+		header = ( cat_name, stig_name, { 'description' : stig['description'] } )
+		for start in range(0, max(len(entries), 1), chunk) :
+			run = [ ( store[id], first_stig ) for id, first_stig in entries[start : start + chunk] ]
+			yield header, run
+			header = None
+
+## DetailSpool
+#
+# Finding details formatted ahead of time, while the report is still being collected
+# (see FindingsAndTools.collectPipelined).  STIGs are added in report order as they become
+# ready, formatted straight away (by the render pool when there are several workers), and
+# kept in a temporary file until the FO file is written.
+class DetailSpool :
+	def __init__(self, workers = 1) :
+		self.file     = tempfile.TemporaryFile('w+', encoding = 'utf-8', errors = 'xmlcharrefreplace')
+		self.rendered = {}
+		self.pool     = None
+		self.waiting  = collections.deque()
+		self.window   = workers * FRAGMENTS_IN_FLIGHT
+		if workers > 1 :
+			self.pool = sharedRenderPool(workers)
+
+	## add
+	#
+	# Format the next STIG.  'cat' is the summary key of its CAT ('cat1')
+	def add(self, cat, stig_name, stig, store) :
+		entries = planStig(self.rendered, stig_name, stig)
+		header = ( CAT_NAMES[cat], stig_name, { 'description' : stig['description'] } )
+		for start in range(0, max(len(entries), 1), FRAGMENT_FINDINGS) :
+			task = ( header, [ ( store[id], first_stig ) for id, first_stig in entries[start : start + FRAGMENT_FINDINGS] ] )
+			header = None
+			if self.pool is None :
+				self.file.write(renderFragment(task))
+			else :
+				self.waiting.append(self.pool.submit(renderFragment, task))
+				while len(self.waiting) > self.window :
+					self.file.write(self.waiting.popleft().result())
+		self.drain(False)
+
+	## drain
+	#
+	# Write the fragments the pool has finished, in order.  With 'wait', wait for all
+	def drain(self, wait) :
+		while len(self.waiting) > 0 and ( wait or self.waiting[0].done() ) :
+			self.file.write(self.waiting.popleft().result())
+
+	## writeTo
+	#
+	# Copy the formatted details to 'out'
+	def writeTo(self, out) :
+		self.drain(True)
+		self.file.seek(0)
+		shutil.copyfileobj(self.file, out)
+
+	## close
+	#
+	# Drop the fragments still waiting and the temporary file.  May be called again.
+	def close(self) :
+		for future in self.waiting :
+			future.cancel()
+		self.waiting.clear()
+		self.file.close()
+
+## Shared render pool
+#
+# Return the pool of 'workers' rendering processes, starting it the first time that
+# many are asked for.  The processes are spawned rather than forked, as other reports
+# may be running in threads of this process when the pool starts.
+def sharedRenderPool(workers) :
+	with renderPoolLock :
+		pool = renderPools.get(workers)
+		if pool is None :
+			pool = concurrent.futures.ProcessPoolExecutor(max_workers = workers,
+														  mp_context = multiprocessing.get_context('spawn'))
+			renderPools[workers] = pool
+		return pool
+
+## Stream Finding Details
+#
+# Write the finding details to 'out' (an open text file), one STIG header or finding at
+# a time, so only that much of the section is ever held in memory.
+#
+# With more than one worker the fragments are formatted by the shared pool of processes,
+# and written here in report order as they complete.  Only FRAGMENTS_IN_FLIGHT per
+# process are submitted ahead of the one being written, so memory stays bounded
+# however large the section.
+def streamDetails(out, summary, workers = 1) :
+
+	if workers > 1 :
+		pool = sharedRenderPool(workers)
+		waiting = collections.deque()
+		try :
+			for task in fragmentTasks(summary, FRAGMENT_FINDINGS) :
+				waiting.append(pool.submit(renderFragment, task))
+				if len(waiting) > workers * FRAGMENTS_IN_FLIGHT :
+					out.write(waiting.popleft().result())
+			while len(waiting) > 0 :
+				out.write(waiting.popleft().result())
+		finally :
+			for future in waiting :
+				future.cancel()
+		return
+
+	holder = ET.Element('details')
+	for step in processCats(holder, summary) :
+		for elem in holder :
+			out.write(ET.tostring(elem, encoding = 'unicode'))
+		holder.clear()
 	
 ### Format Finding Details
 #
 # This formats the individual finding details.  We begin at the STIG level, and 
 # loop through each STIG, followed by looping through all of the findings that
-# are associated with it.  Formatting the cells as we go.
+# are associated with it.  Formatting the cells as we go.  A finding in more than
+# one STIG is detailed the first time only, and referenced after that.
+#
+# When the report is streamed ('streams' is in the parameters) nothing is added to the
+# template.  A placeholder comment takes the place of the details, and streamDetails is
+# registered to write them when the FO file is written, using 'render_workers'
+# processes.  If they were formatted during collection ('details_spool'), the spool is
+# copied instead.
 #
 def details(parms) :
 
@@ -154,8 +411,20 @@ def details(parms) :
 	parent = parms['parent']
 	parent.remove(parms['child'])
 	
-	# Start the process by looping across all of the cats.  There are three.
-	# actual formatting is performed in the subroutine.
-	cat_name = { 'cat1' : 'CAT I', 'cat2' : 'CAT II', 'cat3' : 'CAT III' }
-	for cat in [ 'cat1', 'cat2', 'cat3' ] :
-		processStig(parent, cat_name[cat], parms['summary'][cat])
+	summary = parms['summary']
+	streams = parms.get('streams')
+	if streams is not None :
+		workers = parms.get('render_workers', 1)
+		marker = 'CodeDx stream ' + str(len(streams))
+		parent.append(ET.Comment(marker))
+		spool = parms.get('details_spool')
+		if spool is not None :
+			streams.append(( marker, spool.writeTo ))
+		else :
+			streams.append(( marker, lambda out : streamDetails(out, summary, workers) ))
+		return
+	
+	# Start the process by looping across all of the cats.  The actual formatting is
+	# performed in the subroutines.
+	for step in processCats(parent, summary) :
+		pass
@@ -0,0 +1,193 @@
+## Finding Records
+#
+# Compact records for the findings kept in the report's 'summary_data'.  A project can
+# have 100k findings, and as nested dictionaries (the finding, its location, a list of
+# tool dictionaries and their metadata) the dictionary overhead dominated the memory
+# used while collecting.  These classes use __slots__ instead, and share what repeats:
+#
+#	- tool names, rule names and file paths are interned strings
+#	- a location (file, line) is a single shared Location object
+#	- empty metadata is one shared dictionary
+#
+# The records still answer plain dictionary access ( finding['location']['path'] ) so
+# custom content handlers written against the dictionary layout keep working, and
+# asDict() returns the full nested dictionaries when those are really needed.
+#
+# The FindingStore holds each of a project's findings once, by ID, and the locations
+# they share.
+import sys
+
+## RecordAccess
+#
+# Dictionary style access to the slots of a record.  Missing keys raise KeyError, as
+# they would for a dictionary.
+class RecordAccess :
+	__slots__ = ()
+
+	def __getitem__(self, key) :
+		if not key in self.__slots__ :
+			raise KeyError(key)
+		return getattr(self, key)
+
+	def __setitem__(self, key, value) :
+		if not key in self.__slots__ :
+			raise KeyError(key)
+		setattr(self, key, value)
+
+	def __contains__(self, key) :
+		return key in self.__slots__
+
+	def get(self, key, default = None) :
+		try :
+			return self[key]
+		except KeyError :
+			return default
+
+	def keys(self) :
+		return list(self.__slots__)
+
+	def items(self) :
+		return [ ( key, getattr(self, key) ) for key in self.__slots__ ]
+
+## Location
+#
+# Where a finding is: file path, Code Dx file ID and line.  Shared between findings.
+class Location(RecordAccess) :
+	__slots__ = ( 'path', 'fileid', 'line' )
+
+	def __init__(self, path, fileid, line) :
+		self.path = path
+		self.fileid = fileid
+		self.line = line
+
+	def asDict(self) :
+		return { 'path' : self.path, 'fileid' : self.fileid, 'line' : self.line }
+
+## ToolResult
+#
+# One tool's report of a finding: the tool name and the tool's metadata dictionary
+class ToolResult(RecordAccess) :
+	__slots__ = ( 'name', 'metadata' )
+
+	def __init__(self, name, metadata) :
+		self.name = name
+		self.metadata = metadata
+
+	def asDict(self) :
+		return { 'name' : self.name, 'metadata' : dict(self.metadata) }
+
+## Finding
+#
+# A finding as the report uses it.  'code' is filled in when the snippets are collected.
+class Finding(RecordAccess) :
+	__slots__ = ( 'id', 'error', 'location', 'tools', 'code' )
+
+	def __init__(self, id, error, location, tools, code = '') :
+		self.id = id
+		self.error = error
+		self.location = location
+		self.tools = tools
+		self.code = code
+
+	def asDict(self) :
+		return { 'id'       : self.id,
+				 'error'    : self.error,
+				 'location' : self.location.asDict(),
+				 'tools'    : [ tool.asDict() for tool in self.tools ],
+				 'code'     : self.code }
+
+# shared by every finding with no location, and by every tool result with no metadata.
+# Neither may be changed.
+NO_LOCATION = Location('', '', '')
+NO_METADATA = {}
+
+## fromCodeDx
+#
+# Build a Finding from one finding of the Code Dx findings table, sharing the locations
+# of 'store'
+def fromCodeDx(finding, store) :
+	try :
+		where = store.location(finding['location']['path']['path'],
+							   finding['location']['path']['id'],
+							   finding['location']['lines']['start'])
+	except :
+		where = NO_LOCATION
+
+	tools = []
+	for result in finding['results'] :
+		# metadata may not exist.  If no metadata, we share the blank dictionary.
+		metadata = result.get('metadata') or NO_METADATA
+		tools.append(ToolResult(sys.intern(result['tool']), metadata))
+
+	return Finding(finding['id'], sys.intern(finding['descriptor']['name']), where, tools)
+
+## FindingStore
+#
+# Every finding of a project, once, keyed by Code Dx finding ID.  A finding that maps to
+# several STIGs is stored (and its code snippet collected) a single time; the STIGs hold
+# its ID.  Adding is safe from the collection threads.
+#
+# Locations are shared only within the store, so the reports of a batch, each with its
+# own store, never share (or clear) each other's.
+class FindingStore :
+	def __init__(self) :
+		self.findings = {}
+		self.locations = {}
+
+	# the locations are only needed while collecting, and are not kept in a snapshot
+	def __getstate__(self) :
+		return { 'findings' : self.findings }
+
+	def __setstate__(self, state) :
+		self.findings = state['findings']
+		self.locations = {}
+
+	## location
+	#
+	# Return the shared Location for a path, file ID and line.  Setting a missing key is
+	# safe across the collection threads; at worst two threads each build the same
+	# location and one is kept.
+	def location(self, path, fileid, line) :
+		key = ( fileid, line, path )
+		found = self.locations.get(key)
+		if found is None :
+			found = self.locations.setdefault(key, Location(sys.intern(path), fileid, line))
+		return found
+
+	## add
+	#
+	# Store a finding from the Code Dx findings table, unless it is already stored, and
+	# return its ID
+	def add(self, finding) :
+		id = finding['id']
+		if not id in self.findings :
+			self.findings.setdefault(id, fromCodeDx(finding, self))
+		return id
+
+	## keep
+	#
+	# Store a finding that is already a record (from an earlier run's snapshot)
+	def keep(self, record) :
+		self.findings.setdefault(record.id, record)
+
+	def __getitem__(self, id) :
+		return self.findings[id]
+
+	def __contains__(self, id) :
+		return id in self.findings
+
+	def __len__(self) :
+		return len(self.findings)
+
+	def __iter__(self) :
+		return iter(self.findings.values())
+
+	## uniqueCount
+	#
+	# Number of distinct findings across the STIGs of a 'cat'.  A finding counted under
+	# two of its STIGs is counted once here.
+	def uniqueCount(self, in_cat) :
+		ids = set()
+		for cat in in_cat.values() :
+			ids.update(cat['findings'])
+		return len(ids)
@@ -4,6 +4,13 @@
 import re
 import json
 import sys
+import concurrent.futures
+import threading
+import asyncio
+import codedxasync
+import FindingRecord
+import StigSnapshot
+import Profiler
 
 ## Helper routine to fill in structure data
 #
@@ -66,123 +73,370 @@ def CollectFiltersAndStigData(stig_data, cat1, cat2, cat3) :
 		
 	fillData(stack, cat3)
 
+## stigFilter
+#
+# Build the findings table query for a single STIG, and the parameters sent with it
+def stigFilter(cat) :
+
+	# use the filter_id item to construct a query filter that will be used for this
+	# item's results
+	filter = { 'filter' : { '~status' : [ 'ignored', 'false-positive', 'mitigated', 'gone', 'fixed'] }}
+	filter['filter']['standard'] = cat['filter_id']
+	filter['sort'] = { 'by' : 'id', 'direction' : 'ascending' }
+	params = { 'expand' : 'results.descriptor,results.metadata' }
+	return filter, params
+
+## collectStigFindings
+#
+# Query the findings for a single STIG, add them to the finding store and return their
+# IDs.  This is the unit of work handed to the collection threads, so apart from the
+# store (which allows it) it must not touch any shared structure.
+def collectStigFindings(cat, cdx, project_id, store) :
+
+	# gather the information for the findings for this STIG from Code Dx.  Every page
+	# is read, and each finding is stored as it arrives
+	filter, params = stigFilter(cat)
+	findings = cdx.findingTableIter(project_id, filter, params)
+	
+	# now that we have fingings, lets keep the ones we have not seen for this 'cat'
+	return [ store.add(finding) for finding in findings ]
+
+## collectStigFindingsAsync
+#
+# The coroutine version of collectStigFindings, for the AsyncCodeDx client
+async def collectStigFindingsAsync(cat, acdx, project_id, store) :
+
+	filter, params = stigFilter(cat)
+	return [ store.add(finding) async for finding in acdx.findingTableIter(project_id, filter, params) ]
+
 ## processFindings
 #
 # Process reads for a list of findings for each of the STIGS.  They are grouped by CAT
 # level only.  This may change in the future
-def processFindings(in_cat, cdx, project_id) :
+#
+# When a thread pool is given, the STIG queries are all submitted to it at once and the
+# results are collected back in the dictionary's order.  The resulting 'cat' structure
+# is the same as a serial collection.  The caller tallies the results (tallyFindings).
+def processFindings(in_cat, cdx, project_id, store, pool = None) :
 		
 	# begin by looping through all of the 'cat' name dictionaries.  We use each entry to
 	# gather data from the Code Dx server
+	if pool is None :
+		results = ( collectStigFindings(cat, cdx, project_id, store) for cat in in_cat.values() )
+	else :
+		futures = [ pool.submit(collectStigFindings, cat, cdx, project_id, store) for cat in in_cat.values() ]
+		results = ( future.result() for future in futures )
+	
+	for cat, findings in zip(in_cat.values(), results) :
+		
+		# add all of this data to the incoming 'cat'
+		cat['findings'] = findings
+
+## tallyFindings
+#
+# Report the number of findings collected for each STIG against the count from the
+# grouped counts, and return the total for the 'cat'.
+def tallyFindings(in_cat) :
+
 	total = 0
 	for key, cat in in_cat.items() :
-		# use the filter_id item to construct a query filter that will be used for this
-		# item's results
-		filter = { 'filter' : { '~status' : [ 'ignored', 'false-positive', 'mitigated', 'gone', 'fixed'] }}
-		filter['filter']['standard'] = cat['filter_id']
-		filter['sort'] = { 'by' : 'id', 'direction' : 'ascending' }
-		filter['pagination'] = { 'page' : 1, 'perPage' : 2500 }
-		
-		# gather the information for the findings for this STIG from Code Dx
-		params = { 'expand' : 'results.descriptor,results.metadata' }
-		findings = cdx.findingTableData(project_id, filter, params)
-		
-		# now that we have fingings, lets format the information into this 'cat'
-		cat['findings'] = []
-		for finding in findings :
-			# create a dictionary to collect the findings into
-			list = {}
-			list['id']    = finding['id']
-			list['error'] = finding['descriptor']['name']
-			try :
-				list['location'] = { 'path'   : finding['location']['path']['path'],
-									 'fileid' : finding['location']['path']['id'],
-									 'line'   : finding['location']['lines']['start']
-								   }
-			except :
-				list['location'] = { 'path' : '', 'file' : '', 'line' : '' }
-					
-			list['tools'] = [ ]
-			for result in finding['results'] :
-				tool_item = { }
-				tool_item['name'] = result['tool']
-				
-				# metadata may not exist.  We try to put it here anyway.  If no metadata,
-				# we simply insert a blank dictionary.
-				try :
-					tool_item['metadata'] = result['metadata']
-				except :
-					tool_item['metadata'] = { }
-					
-				list['tools'].append(tool_item)
-					
-			# add all of this data to the incoming 'cat'
-			cat['findings'].append(list)
-		
-		# after all of the findings have been added, collect the total
 		total += len(cat['findings'])
-		
 		print("|-- [processFindings] " + cat['name'] + " - records = " + str(len(cat['findings'])) + " and fcount = " + str(cat['fcount']))
 	
-	# return the total number of items to the caller
 	return total
 
+## standardNodeId
+#
+# Reduce a standard node reference to its number.  The filter IDs from the grouped
+# counts look like 'standard-node:3287', while a finding's standards may carry the
+# bare number.
+def standardNodeId(node) :
+	if isinstance(node, dict) :
+		node = node['id']
+	return str(node).split(':')[-1]
+
+## processBulkFindings
+#
+# Fill the 'findings' of every STIG in all three cats from a single walk of the findings
+# table.  Each open finding in any of the STIGs is downloaded once along with the
+# standards it maps to, then placed in each STIG it belongs to through a local index
+# of filter IDs.  A finding in several STIGs is stored once and its ID added to each.
+#
+# The findings arrive sorted by ID, so every STIG's list is in the same order as a
+# per-STIG query would return it.
+def processBulkFindings(in_cats, cdx, project_id, store) :
+
+	# index all of the STIGs by their standard node
+	index = {}
+	for in_cat in in_cats :
+		for key, cat in in_cat.items() :
+			cat['findings'] = []
+			index[standardNodeId(cat['filter_id'])] = cat
+	
+	if len(index) == 0 :
+		return
+	
+	# one filter covering every STIG we report on
+	filter = { 'filter' : { '~status' : [ 'ignored', 'false-positive', 'mitigated', 'gone', 'fixed'] }}
+	filter['filter']['standard'] = [ cat['filter_id'] for cat in index.values() ]
+	filter['sort'] = { 'by' : 'id', 'direction' : 'ascending' }
+	params = { 'expand' : 'descriptor.standards,results.descriptor,results.metadata' }
+	
+	downloaded = 0
+	mapped = 0
+	for finding in cdx.findingTableIter(project_id, filter, params) :
+		downloaded += 1
+		formatted = None
+		try :
+			standards = finding['descriptor']['standards']
+		except KeyError :
+			standards = []
+			
+		for node in standards :
+			cat = index.get(standardNodeId(node))
+			if cat is None :
+				continue
+			if formatted is None :
+				formatted = store.add(finding)
+				mapped += 1
+			cat['findings'].append(formatted)
+	
+	print("|-- [processBulkFindings] downloaded " + str(downloaded) + " findings, " + str(mapped) + " mapped to a STIG")
+	if downloaded > 0 and mapped == 0 :
+		print("|-- [processBulkFindings] WARNING: no standard mappings returned.  Use collection_mode = stig for this server")
+
 ## processToolCounts
 #
-# Using the incoming structure, we count the tools into the tools dictionary.
+# Using the incoming structure, we count the tools into the tools dictionary.  A finding
+# is counted for each STIG it appears in.
 #
-def processToolCounts(in_cat, tools) :
+def processToolCounts(in_cat, tools, store) :
 
 	# loop through all of the names from the in_cat structure and create counters for tools
 	# that exist
 	total_findings = 0
 	for key, cat in in_cat.items() :
-		# look into the 'findings' field to grab the tool names
-		for finding in cat['findings'] :
-			# now loop through the tools section
-			for t in finding['tools'] :
-				# look for the name in the incoming 'tools' dictionary.  If it does not exist
-				# we simply create it
-				try :
-					tools[t['name']]['count'] += 1
-					total_findings += 1
-				except :
-					tools[t['name']] = { }
-					tools[t['name']]['count'] = 1
-					total_findings += 1
+		total_findings += countTools(cat, tools, store)
+	
+	return total_findings
+
+## countTools
+#
+# Count the tools of one STIG's findings into the tools dictionary, and return the number
+# counted
+def countTools(cat, tools, store) :
+
+	total_findings = 0
+	# look into the 'findings' field to grab the tool names
+	for id in cat['findings'] :
+		# now loop through the tools section
+		for t in store[id].tools :
+			# look for the name in the incoming 'tools' dictionary.  If it does not exist
+			# we simply create it
+			try :
+				tools[t.name]['count'] += 1
+				total_findings += 1
+			except :
+				tools[t.name] = { }
+				tools[t.name]['count'] = 1
+				total_findings += 1
 	
 	return total_findings
 
+## groupByFile
+#
+# Group the stored findings that still need a code snippet by source file ID.  Findings
+# with no file are grouped under ''.  Findings that already have their snippet (taken
+# from an incremental snapshot) are left out, as SnippetDispatcher leaves them out.
+def groupByFile(store) :
+
+	by_file = {}
+	for finding in store :
+		if finding.code != '' :
+			continue
+		by_file.setdefault(finding.location.fileid, []).append(finding)
+	return by_file
+
+## escapeCode
+#
+# convert each of the 5 items that could be in code to a value that can be stored
+# in an XML file
+def escapeCode(tmpstr) :
+	#tmpstr = tmpstr.replace('&', '&amp;')
+	tmpstr = tmpstr.replace('<', '&lt;')
+	tmpstr = tmpstr.replace('>', '&gt;')
+	# tmpstr = tmpstr.replace('"', '&quot;')
+	#tmpstr = tmpstr.replace("'", '&apos;')
+	return tmpstr
+
 ## Collect Code Snippets
 #
-# Loop through all of the different findings, and put in the code snippet.  We do this
-# the easy way that probably consumes the most CPU cycles
-def collectCodeSnippets(in_cat, cdx, project_id, code_linecount) :
+# Loop through all of the different findings, and put in the code snippet.  Each stored
+# finding gets one snippet however many STIGs it is in, and the findings are grouped by
+# source file first so each file is downloaded once.  Findings that already have a
+# snippet are skipped, so no file is downloaded for them.
+def collectCodeSnippets(store, cdx, project_id, code_linecount) :
 
-	# here we go... start by accessing a loop around the finding STIGs
-	for key, cat in in_cat.items() :
+	# here we go... work through one file at a time
+	for fileid, findings in groupByFile(store).items() :
+		snippetsForFile(fileid, findings, cdx, project_id, code_linecount)
+
+## snippetsForFile
+#
+# Put in the code snippets of some findings in one source file
+def snippetsForFile(fileid, findings, cdx, project_id, code_linecount) :
+	for finding in findings :
+	
+		# We have a finding.  Using the 'location' we collect what we need from the call
+		tmpstr = ' '
+		if fileid != '' :
+			tmpstr = cdx.getFileLines(project_id, finding.location, int(code_linecount))
+		finding.code = escapeCode(tmpstr)
+
+## SnippetDispatcher
+#
+# The snippet stage of the pipelined collection.  As each STIG's findings arrive, the
+# findings still without a snippet are grouped by file and handed to the snippet pool.
+# A finding is only handed over once, by the first STIG to arrive with it, and a file is
+# worked on by one thread at a time so it is downloaded once.  'wait' returns when every
+# snippet of a STIG is in, whichever STIG handed them over.
+class SnippetDispatcher :
+	def __init__(self, pool, store, cdx, project_id, code_linecount) :
+		self.pool      = pool
+		self.store     = store
+		self.cdx       = cdx
+		self.projectId = project_id
+		self.linecount = code_linecount
+		self.lock      = threading.Lock()
+		self.owners    = {}	# finding ID to the future collecting its snippet
+		self.fileLocks = {}
+
+	## dispatch
+	#
+	# Start collecting the snippets of a STIG that has its findings
+	def dispatch(self, cat) :
+		by_file = {}
+		with self.lock :
+			for id in cat['findings'] :
+				finding = self.store[id]
+				if finding.code != '' or id in self.owners :
+					continue
+				by_file.setdefault(finding.location.fileid, []).append(finding)
+			
+			for fileid, findings in by_file.items() :
+				file_lock = self.fileLocks.setdefault(fileid, threading.Lock())
+				future = self.pool.submit(self.collect, file_lock, fileid, findings)
+				for finding in findings :
+					self.owners[finding.id] = future
+
+	## collect
+	#
+	# The unit of work for the snippet pool
+	def collect(self, file_lock, fileid, findings) :
+		with file_lock :
+			snippetsForFile(fileid, findings, self.cdx, self.projectId, self.linecount)
+
+	## wait
+	#
+	# Wait for the snippets of a STIG
+	def wait(self, cat) :
+		with self.lock :
+			futures = set([ self.owners[id] for id in cat['findings'] if id in self.owners ])
+		for future in futures :
+			future.result()
+
+## collectPipelined
+#
+# Collect the findings and code snippets of every STIG as a pipeline rather than in
+# stages.  The STIG queries run on one pool of 'workers' threads.  As soon as a STIG's
+# findings are in, its snippets are started on a second pool, and this thread takes the
+# STIGs in report order: once a STIG's snippets are in its tools are counted and it is
+# passed to 'ready' (when given) as ready( cat, STIG name, STIG, store ), so the report
+# can be formatting it while later STIGs are still being collected.
+#
+# Only the STIGs in 'pending' are queried; the others already have their findings.
+# Returns the number of tool findings counted into 'tools'.
+def collectPipelined(in_cats, pending, cdx, project_id, store, code_linecount, workers, tools, ready = None) :
+
+	fetch_pool = concurrent.futures.ThreadPoolExecutor(max_workers = workers)
+	snippet_pool = concurrent.futures.ThreadPoolExecutor(max_workers = workers)
+	snippets = SnippetDispatcher(snippet_pool, store, cdx, project_id, code_linecount)
+	
+	def fetch(cat) :
+		cat['findings'] = collectStigFindings(cat, cdx, project_id, store)
+		snippets.dispatch(cat)
 	
-		# loop into each of the STIGs findings
-		for finding in cat['findings'] :
+	total_findings = 0
+	try :
+		fetches = {}
+		for todo in pending :
+			for key, cat in todo.items() :
+				fetches[id(cat)] = fetch_pool.submit(fetch, cat)
 		
-			# We have a finding.  Using the 'location' we collect what we need from the call
-			tmpstr = cdx.getFileLines(project_id, finding['location'], int(code_linecount))
+		for name, in_cat in zip([ 'cat1', 'cat2', 'cat3' ], in_cats) :
+			for key, cat in in_cat.items() :
+				if id(cat) in fetches :
+					fetches[id(cat)].result()
+				else :
+					snippets.dispatch(cat)
+				snippets.wait(cat)
+				total_findings += countTools(cat, tools, store)
+				if ready is not None :
+					ready(name, key, cat, store)
+	finally :
+		fetch_pool.shutdown(cancel_futures = True)
+		snippet_pool.shutdown(cancel_futures = True)
+	
+	return total_findings
+
+## collectCodeSnippetsAsync
+#
+# The coroutine version of collectCodeSnippets.  Every file is downloaded concurrently,
+# and its snippets cut as soon as it arrives.
+async def collectCodeSnippetsAsync(store, acdx, project_id, code_linecount) :
+
+	async def snippetsForFile(fileid, findings) :
+		source = None
+		if fileid != '' :
+			source = await acdx.getSource(project_id, fileid)
 			
-			# convert each of the 5 items that could be in code to a value that can be stored
-			# in an XML file
-			#tmpstr = tmpstr.replace('&', '&amp;')
-			tmpstr = tmpstr.replace('<', '&lt;')
-			tmpstr = tmpstr.replace('>', '&gt;')
-			# tmpstr = tmpstr.replace('"', '&quot;')
-			#tmpstr = tmpstr.replace("'", '&apos;')
-			finding['code'] = tmpstr
+		# the snippets are cut from the spooled file off the event loop
+		await acdx.blocking(cutSnippets, source, findings)
+
+	def cutSnippets(source, findings) :
+		for finding in findings :
+			tmpstr = ' '
+			if source is not None :
+				tmpstr = acdx.sources.snippet(source, finding.location.line, code_linecount)
+			finding.code = escapeCode(tmpstr)
+	
+	by_file = groupByFile(store)
+	await asyncio.gather(*[ snippetsForFile(fileid, findings) for fileid, findings in by_file.items() ])
+
+## collectAsync
+#
+# Collect the findings of every STIG, then their code snippets, on one event loop
+# through an AsyncCodeDx client.  The client shares the response cache and source
+# spool of 'cdx'.
+async def collectAsync(ini, cdx, in_cats, store, project_id, code_linecount) :
+
+	async with codedxasync.AsyncCodeDx(ini, cdx.cache, cdx.latestAnalysis, cdx.sources) as acdx :
+		
+		# every STIG query is started at once.  The client limits how many are in flight
+		stigs = [ cat for in_cat in in_cats for cat in in_cat.values() ]
+		results = await asyncio.gather(*[ collectStigFindingsAsync(cat, acdx, project_id, store) for cat in stigs ])
+		for cat, findings in zip(stigs, results) :
+			cat['findings'] = findings
+		
+		await collectCodeSnippetsAsync(store, acdx, project_id, code_linecount)
+		acdx.reportFileStats()
 
 
 	
 ## Main Entry Point 'get'
 #
 #	
-def get(ini, cdx, project_id, code_linecount) :
+def get(ini, cdx, project_id, code_linecount, ready = None) :
 	
 	# this will get complicated.  Hence a new file in the list!
 	# Here is the new data structure we will be using to return
@@ -199,44 +453,65 @@ def get(ini, cdx, project_id, code_linecount) :
 	#                           'filter_id'   : filter id for later (i.e. 'standard-node:3287')
 	#                           'description' : description of the STIG
 	#                           'fcount'      : count from the origin of the filter. Used for verification
-	#                           'findings'    : [
-	#                                              {
-	#                                                 'id'       : Code Dx ID of the finding
-	#                                                 'location' : {
-	#                                                                 'path'   : path to the file
-	#                                                                 'fileid' : filename of the location
-	#                                                                 'line'   : line number of the location
-	#                                                              }
-	#                                                 'error'    : Name of the rule violated
-	#                                                 'tools'    : [ ] List of dictionary of tool 'name', 'metadata'
-	#                                                 'code'     : continuous string of the code.
-	#                                              }
-	#                                           ]
+	#                           'findings'    : [ ] List of the Code Dx IDs of the findings,
+	#                                           looked up in 'findings' below
 	#                        }
 	#            }
 	#   'cat1Totals' : total finding counts.  May contain duplicates.
+	#   'cat1Unique' : number of distinct findings in the CAT.
 	#
 	#   'cat2' : { 
 	#               ... see 'cat1'
 	#            }
 	#   'cat2Totals' : total finding counts.  May contain duplicates.
+	#   'cat2Unique' : number of distinct findings in the CAT.
 	#
 	#   'cat3' : { 
 	#               ... see 'cat1'
 	#            }
 	#   'cat3Totals' : total finding counts.  May contain duplicates.
+	#   'cat3Unique' : number of distinct findings in the CAT.
+	#
+	#   'findings' : FindingStore of every finding, by ID.  Each is a Finding record (see
+	#                FindingRecord), also readable as this dictionary:
+	#                {
+	#                   'id'       : Code Dx ID of the finding
+	#                   'location' : {
+	#                                   'path'   : path to the file
+	#                                   'fileid' : filename of the location
+	#                                   'line'   : line number of the location
+	#                                }
+	#                   'error'    : Name of the rule violated
+	#                   'tools'    : [ ] List of dictionary of tool 'name', 'metadata'
+	#                   'code'     : continuous string of the code.
+	#                }
 	#   
 	#   'tools' : {
 	#                'name' : {				: name of the tool is the key to this field
 	#                            'count'	: number of findings calculated for this tool
 	#             }
 	#   'toolsFindings' : total of all of the tool findings
+	#   'codeMetrics' : the project's code metrics (lines and files per language)
+	#   'pipelined' : True when the STIGs were collected as a pipeline, and each was
+	#                 passed to 'ready' as it was completed (see collectPipelined)
 	# }
 	#
+	# check the collection mode before anything is asked of the server
+	mode = ini.get('Report', 'collection_mode', fallback = 'stig')
+	if not mode in [ 'stig', 'bulk', 'async' ] :
+		print("|-- [FindingsAndTools.get] ERROR: unknown collection_mode \"" + mode + "\", use stig, bulk or async")
+		raise ValueError("unknown collection mode")
+	
 	retval = { 'stig' : {} }
 	
-	# begin by obtaining the standard we will use for later reference
-	standards = cdx.getStandards()
+	# locations are only shared within one project, by its store
+	store = FindingRecord.FindingStore()
+	retval['findings'] = store
+	
+	# begin by obtaining the standard we will use for later reference.  Each step is a
+	# phase of the profile when the run is profiled
+	with Profiler.phase('standards') :
+		standards = cdx.getStandards()
 	
 	# Generate the information for looking at findings through the lens of STIGs
 	# This section of the database is used to collect the countBy field to allow
@@ -265,10 +540,13 @@ def get(ini, cdx, project_id, code_linecount) :
 	print("|- [FindingsAndTools.get] -- collected STIG version and filtering information")
 	
 	# Collect the grouped counts.  I've not found this to be terribly reliable.  So we simply
-	# access the violation filters for later queries.
+	# access the violation filters for later queries.  In incremental mode the counts are
+	# what decide which STIGs are collected again, so they always come from the server
+	incremental = ini.getboolean('Report', 'incremental', fallback = False) and cdx.cache.mode != 'off'
 	stig_filter = { 'filter': { '~status': [ 'fixed', 'mitigated', 'ignored', 'false-positive' ] } }
 	stig_filter['countBy'] = stig['countBy']
-	stig_data = cdx.findingsGroupedCount(project_id, stig_filter)
+	with Profiler.phase('grouped counts') :
+		stig_data = cdx.findingsGroupedCount(project_id, stig_filter, fresh = incremental)
 	
 	# here is where we collect information about filtering for each of the violated STIGs.  We
 	# are filling out the 'cat' 1/2/3 section of the data structure
@@ -276,33 +554,103 @@ def get(ini, cdx, project_id, code_linecount) :
 	retval['cat2'] = {  }
 	retval['cat3'] = {  }
 	CollectFiltersAndStigData(stig_data, retval['cat1'], retval['cat2'], retval['cat3'])
+	in_cats = [ retval['cat1'], retval['cat2'], retval['cat3'] ]
+	
+	# In incremental mode the STIGs whose counts match the last run's snapshot take their
+	# findings (and snippets) from it, as long as the project has had no new analysis since.
+	# Only the STIGs in 'pending' are collected below.  A --refresh run collects
+	# everything, and saves a fresh snapshot.
+	pending = in_cats
+	if incremental :
+		analysis_id = cdx.getLatestAnalysisId(project_id)
+		snapshot_path = StigSnapshot.snapshotPath(cdx.cache.directory, cdx.url, project_id)
+		snapshot = None
+		with Profiler.phase('snapshot load') :
+			if cdx.cache.mode == 'use' :
+				snapshot = StigSnapshot.load(snapshot_path)
+			pending, reused = StigSnapshot.reuse(snapshot, in_cats, store, analysis_id, stig['countBy'], code_linecount)
+		stig_count = sum([ len(in_cat) for in_cat in in_cats ])
+		print("|- [FindingsAndTools.get] -- reusing " + str(reused) + " of " + str(stig_count) + " STIGs from the last run")
 	
 	# Now the real query work begins.  We loop through all of the category's findings and
 	# gather details for each of the cat levels.  This will populate the information in
-	# the 'findings' portion of each cat.
-	for name in [ 'cat1', 'cat2', 'cat3' ] :
-		print("|- [FindingsAndTools.get] -- " + name.upper() + " Finding collection - length = " + str(len(retval[name])))
-		totals = processFindings(retval[name], cdx, project_id)
-		print("|- [FindingsAndTools.get] -- " + name.upper() + " Totals = " + str(totals))
+	# the 'findings' portion of each cat.  More than one collection worker runs the STIG
+	# queries concurrently.
+	#
+	# In 'bulk' mode the findings for all of the STIGs are downloaded together instead,
+	# and only need to be counted here.  In 'async' mode the findings and their code
+	# snippets are all collected on one event loop.
+	#
+	# In 'stig' mode the collection is normally pipelined: each STIG's snippets are
+	# collected as soon as its findings are in, and its tools counted as soon as those
+	# are done, while other STIGs are still arriving.
+	workers = ini.getint('Report', 'collection_workers', fallback = 1)
+	pipelined = mode == 'stig' and ini.getboolean('Report', 'pipeline', fallback = True)
+	retval['pipelined'] = pipelined
+	retval['tools'] = { }
+	total_findings = 0
+	if pipelined :
+		print("|- [FindingsAndTools.get] -- collecting findings and code snippets as a pipeline with " + str(workers) + " workers")
+		with Profiler.phase('pipeline') :
+			total_findings = collectPipelined(in_cats, pending, cdx, project_id, store, code_linecount, workers, retval['tools'], ready)
+		cdx.reportFileStats()
+	if mode == 'bulk' :
+		print("|- [FindingsAndTools.get] -- collecting all STIG findings in bulk")
+		with Profiler.phase('findings') :
+			processBulkFindings(pending, cdx, project_id, store)
+	if mode == 'async' :
+		print("|- [FindingsAndTools.get] -- collecting findings and code snippets asynchronously")
+		with Profiler.phase('findings and snippets') :
+			asyncio.run(collectAsync(ini, cdx, pending, store, project_id, code_linecount))
+		
+	pool = None
+	if workers > 1 and mode == 'stig' and not pipelined :
+		print("|- [FindingsAndTools.get] -- collecting findings with " + str(workers) + " workers")
+		pool = concurrent.futures.ThreadPoolExecutor(max_workers = workers)
 		
-		# adjust the name to store the totals for this CAT level
-		name += 'Totals'
-		retval[name] = totals
+	try :
+		for name, todo in zip([ 'cat1', 'cat2', 'cat3' ], pending) :
+			print("|- [FindingsAndTools.get] -- " + name.upper() + " Finding collection - length = " + str(len(retval[name])))
+			if mode == 'stig' and not pipelined :
+				with Profiler.phase('findings', cat = name) :
+					processFindings(todo, cdx, project_id, store, pool)
+			totals = tallyFindings(retval[name])
+			unique = store.uniqueCount(retval[name])
+			print("|- [FindingsAndTools.get] -- " + name.upper() + " Totals = " + str(totals) + ", unique = " + str(unique))
+			
+			# store the totals for this CAT level under the adjusted names
+			retval[name + 'Totals'] = totals
+			retval[name + 'Unique'] = unique
+	finally :
+		if pool is not None :
+			pool.shutdown()
 	
 	# Postprocess all of the data to collect the tool counts.  We simply leaf through all three
 	# cats in the data structure, and count into the 'tools' section.  This will tell us the
 	# numbers.  A record for a tool is only created when the tool name is encountered.
-	retval['tools'] = { }
-	total_findings = 0
-	for name in [ 'cat1', 'cat2', 'cat3' ] :
-		total_findings += processToolCounts(retval[name], retval['tools'])
-		print("|- [FindingsAndTools.get] -- Processing tool counts")
+	if not pipelined :
+		with Profiler.phase('tool counts') :
+			for name in [ 'cat1', 'cat2', 'cat3' ] :
+				total_findings += processToolCounts(retval[name], retval['tools'], store)
+				print("|- [FindingsAndTools.get] -- Processing tool counts")
 	
 	# loop through the entire structure and ingest the lines for the requested code lines
-	for name in [ 'cat1', 'cat2', 'cat3' ] :
-		collectCodeSnippets(retval[name], cdx, project_id, code_linecount)
+	if mode != 'async' and not pipelined :
+		print("|- [FindingsAndTools.get] -- Collecting code snippets for " + str(len(store)) + " distinct findings")
+		with Profiler.phase('snippets') :
+			collectCodeSnippets(store, cdx, project_id, code_linecount)
+		cdx.reportFileStats()
+	
+	if incremental :
+		with Profiler.phase('snapshot save') :
+			StigSnapshot.save(snapshot_path, in_cats, store, analysis_id, stig['countBy'], code_linecount)
 	
 	retval['toolsFindings'] = total_findings
+	
+	# the language metrics are kept with the rest, so the report can be written from
+	# a snapshot of this data without the server
+	with Profiler.phase('code metrics') :
+		retval['codeMetrics'] = cdx.getCodeMetrics(project_id)
 
 	# return the data we have collected
 	return retval
@@ -0,0 +1,153 @@
+## Apache FOP Renderer
+#
+# Turns the report's FO file into a PDF through one long lived Java process running
+# FopWorker (FopWorker.java, next to this file).  The JVM and FOP are started once, on
+# the first report, and every later report in the run is sent to the same process, so
+# producing many reports pays the start up cost only once.
+#
+# FOP itself comes from the binary distribution in 'fop_home' (the 'fop' directory of
+# the download, holding build/fop.jar and lib/).  The worker is compiled against those
+# jars into the cache directory the first time, and again whenever FopWorker.java
+# changes.  Java 1.8+ (with javac) is needed, as for the fop command.
+#
+#	renderer = FopRenderer.shared(ini)
+#	renderer.render('example/report.fo', 'example/report.pdf')
+import atexit
+import glob
+import os
+import subprocess
+import threading
+
+WORKER_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'FopWorker.java')
+
+# renderers started during this run, by their settings
+renderers = {}
+renderersLock = threading.Lock()
+
+class FopRenderer :
+	## Constructor
+	#
+	# Nothing is started until the first render
+	def __init__(self, fop_home, work_dir, java = 'java', javac = 'javac', config = None) :
+		self.fopHome = fop_home
+		self.workDir = work_dir
+		self.java    = java
+		self.javac   = javac
+		self.config  = config
+		self.process = None
+		self.lock    = threading.Lock()
+		self.rendered = 0
+
+	## classPath
+	#
+	# The FOP jars, as the fop script collects them: build/*.jar then lib/*.jar
+	def classPath(self) :
+		jars = sorted(glob.glob(os.path.join(self.fopHome, 'build', '*.jar')))
+		jars += sorted(glob.glob(os.path.join(self.fopHome, 'lib', '*.jar')))
+		if len(jars) == 0 :
+			print("|-- [FopRenderer] ERROR: no FOP jars in \"" + os.path.join(self.fopHome, 'build') + "\" or \"lib\"")
+			print("|-- [FopRenderer] point fop_home at the 'fop' directory of the Apache FOP binary distribution")
+			raise ValueError("FOP jars not found")
+		return jars
+
+	## compileWorker
+	#
+	# Build FopWorker.class in the work directory if it is missing or out of date
+	def compileWorker(self, jars) :
+		target = os.path.join(self.workDir, 'FopWorker.class')
+		if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(WORKER_SOURCE) :
+			return
+
+		print("|-- [FopRenderer] compiling the FOP worker")
+		os.makedirs(self.workDir, exist_ok = True)
+		status = subprocess.call([ self.javac, '-cp', os.pathsep.join(jars), '-d', self.workDir, WORKER_SOURCE ])
+		if status != 0 :
+			raise ValueError("javac could not compile " + WORKER_SOURCE)
+
+	## start
+	#
+	# Start the worker and wait for it to load FOP
+	def start(self) :
+		jars = self.classPath()
+		self.compileWorker(jars)
+
+		command = [ self.java, '-cp', os.pathsep.join([ self.workDir ] + jars), 'FopWorker' ]
+		if self.config :
+			command.append(self.config)
+		print("|-- [FopRenderer] starting the FOP worker")
+		self.process = subprocess.Popen(command, stdin = subprocess.PIPE, stdout = subprocess.PIPE,
+										universal_newlines = True, encoding = 'utf-8', bufsize = 1)
+		ready = self.process.stdout.readline().strip()
+		if ready != 'READY' :
+			self.close()
+			raise ValueError("the FOP worker did not start")
+
+	## render
+	#
+	# Render an FO file to a PDF file.  Reports are rendered one at a time; other
+	# threads wait their turn.  A worker that has died is started again once.
+	def render(self, fo_file, pdf_file) :
+		request = os.path.abspath(fo_file) + '\t' + os.path.abspath(pdf_file) + '\n'
+		with self.lock :
+			for attempt in range(2) :
+				if self.process is None or self.process.poll() is not None :
+					self.start()
+				try :
+					self.process.stdin.write(request)
+					self.process.stdin.flush()
+					answer = self.process.stdout.readline()
+				except OSError :
+					answer = ''
+				if answer != '' :
+					break
+				self.close()
+			else :
+				raise ValueError("the FOP worker stopped")
+
+		status, detail = ( answer.rstrip('\n').split('\t', 1) + [ '' ] )[:2]
+		if status != 'OK' :
+			print("|-- [FopRenderer] ERROR: " + detail)
+			raise ValueError("FOP could not render " + fo_file)
+		self.rendered += 1
+
+	## close
+	#
+	# Stop the worker.  It ends once its input is closed
+	def close(self) :
+		process = self.process
+		self.process = None
+		if process is None :
+			return
+		try :
+			process.stdin.close()
+			process.wait(timeout = 30)
+		except (OSError, subprocess.TimeoutExpired) :
+			process.kill()
+			process.wait()
+
+## shared
+#
+# Return the renderer for the '[Report]' FOP settings, starting one the first time.  The
+# same renderer is used for every report of the run, and stopped when the run ends.
+def shared(ini) :
+	fop_home = ini.get('Report', 'fop_home', fallback = os.path.join('example', 'fop-2.5', 'fop'))
+	java     = ini.get('Report', 'java', fallback = 'java')
+	javac    = ini.get('Report', 'javac', fallback = 'javac')
+	config   = ini.get('Report', 'fop_config', fallback = '') or None
+	work_dir = os.path.join(ini.get('CodeDx', 'cache_dir', fallback = '.cdxcache'), 'fop')
+
+	key = ( os.path.abspath(fop_home), java, javac, config )
+	with renderersLock :
+		if not key in renderers :
+			renderers[key] = FopRenderer(fop_home, work_dir, java, javac, config)
+		return renderers[key]
+
+## closeAll
+#
+# Stop every renderer started during the run
+def closeAll() :
+	with renderersLock :
+		for renderer in renderers.values() :
+			renderer.close()
+
+atexit.register(closeAll)
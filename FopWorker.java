@@ -0,0 +1,123 @@
+// FOP Worker
+//
+// A long lived Apache FOP process for FopRenderer.py.  Starting the JVM and setting up
+// FOP (fonts, hyphenation, image handling) costs seconds, which every 'fop' command
+// line run pays again.  This worker pays it once and renders one report after another.
+//
+// Requests arrive on standard input, one per line:
+//
+//	<FO file> TAB <PDF file>
+//
+// and each is answered on standard output with one line:
+//
+//	OK TAB <PDF file>
+//	ERROR TAB <message>
+//
+// "READY" is written once FOP is loaded.  FOP's own messages go to standard error, so
+// they never mix with the answers.  The worker ends when standard input is closed.
+//
+// Relative references in a report (images, say) are resolved against the directory of
+// its FO file, as the fop command does.  An optional FOP configuration file may be
+// given as the only argument.
+//
+// Build it against the FOP jars (FopRenderer.py does this when needed):
+//
+//	javac -cp "fop/build/*:fop/lib/*" -d <directory> FopWorker.java
+
+import java.io.BufferedOutputStream;
+import java.io.BufferedReader;
+import java.io.File;
+import java.io.FileDescriptor;
+import java.io.FileInputStream;
+import java.io.FileOutputStream;
+import java.io.InputStream;
+import java.io.InputStreamReader;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.net.URI;
+import java.util.HashMap;
+import java.util.Map;
+
+import javax.xml.transform.Transformer;
+import javax.xml.transform.TransformerFactory;
+import javax.xml.transform.sax.SAXResult;
+import javax.xml.transform.stream.StreamSource;
+
+import org.apache.fop.apps.FOUserAgent;
+import org.apache.fop.apps.Fop;
+import org.apache.fop.apps.FopConfParser;
+import org.apache.fop.apps.FopFactory;
+import org.apache.fop.apps.MimeConstants;
+
+public class FopWorker {
+
+	private final File config;
+	private final Map<URI, FopFactory> factories = new HashMap<URI, FopFactory>();
+	private final TransformerFactory transformers = TransformerFactory.newInstance();
+
+	FopWorker(File config) {
+		this.config = config;
+	}
+
+	// One FOP factory per base directory.  A factory holds the font and image caches,
+	// so reports from the same directory share them.
+	private FopFactory factory(URI base) throws Exception {
+		FopFactory factory = factories.get(base);
+		if (factory == null) {
+			if (config == null) {
+				factory = FopFactory.newInstance(base);
+			} else {
+				try (InputStream conf = new FileInputStream(config)) {
+					factory = new FopConfParser(conf, base).getFopFactoryBuilder().build();
+				}
+			}
+			factories.put(base, factory);
+		}
+		return factory;
+	}
+
+	// Render one FO file to PDF
+	void render(File fo, File pdf) throws Exception {
+		FopFactory factory = factory(fo.getAbsoluteFile().getParentFile().toURI());
+		FOUserAgent agent = factory.newFOUserAgent();
+		try (OutputStream out = new BufferedOutputStream(new FileOutputStream(pdf))) {
+			Fop fop = factory.newFop(MimeConstants.MIME_PDF, agent, out);
+			Transformer transformer = transformers.newTransformer();
+			transformer.transform(new StreamSource(fo), new SAXResult(fop.getDefaultHandler()));
+		}
+	}
+
+	// Keep a message on one line of the answer
+	private static String oneLine(Throwable e) {
+		String message = e.toString();
+		for (Throwable cause = e.getCause(); cause != null; cause = cause.getCause()) {
+			message += " caused by " + cause;
+		}
+		return message.replace('\t', ' ').replace('\r', ' ').replace('\n', ' ');
+	}
+
+	public static void main(String[] args) throws Exception {
+		// the answers have standard output to themselves
+		PrintStream answers = new PrintStream(new FileOutputStream(FileDescriptor.out), true, "UTF-8");
+		System.setOut(System.err);
+
+		FopWorker worker = new FopWorker(args.length > 0 ? new File(args[0]) : null);
+		BufferedReader requests = new BufferedReader(new InputStreamReader(System.in, "UTF-8"));
+		answers.println("READY");
+
+		String request;
+		while ((request = requests.readLine()) != null) {
+			String[] files = request.split("\t");
+			if (files.length != 2) {
+				answers.println("ERROR\tbad request: " + request.replace('\t', ' '));
+				continue;
+			}
+			try {
+				worker.render(new File(files[0]), new File(files[1]));
+				answers.println("OK\t" + files[1]);
+			} catch (Throwable e) {
+				answers.println("ERROR\t" + oneLine(e));
+			}
+		}
+	}
+}
@@ -0,0 +1,188 @@
+## Profiler
+#
+# Where a report run spends its time.  With --profile, report.py starts a profile and
+# the code marks its phases:
+#
+#	with Profiler.phase('collect') :
+#		...
+#
+# Phases may nest and may run on several threads at once.  The Code Dx clients report
+# every request they send, by endpoint ('POST /projects/{id}/findings/table'), with its
+# latency and the bytes received.  At the end two files are written:
+#
+#	<base>.json       - a summary: total time per phase and per content handler, and
+#	                    request counts, bytes and a latency histogram per endpoint
+#	<base>.trace.json - every phase and request as Chrome trace events, for
+#	                    chrome://tracing or https://ui.perfetto.dev
+#
+# When no profile is running the calls cost next to nothing.
+import contextlib
+import json
+import os
+import re
+import threading
+import time
+import urllib.parse
+
+# upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS = [ 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000 ]
+
+# the running profile, if any
+current = None
+
+class Profile :
+	## Constructor
+	#
+	# Times are kept relative to the start of the profile
+	def __init__(self) :
+		self.origin    = time.perf_counter()
+		self.lock      = threading.Lock()
+		self.events    = []
+		self.threads   = {}
+		self.totals    = {}	# ( category, name ) to count and seconds
+		self.endpoints = {}
+
+	## now
+	#
+	# Microseconds since the profile started, as trace events count time
+	def now(self) :
+		return ( time.perf_counter() - self.origin ) * 1000000
+
+	## record
+	#
+	# Add one complete event, and count it toward its category's totals
+	def record(self, category, name, start, duration, args = None) :
+		thread = threading.current_thread()
+		event = { 'name' : name, 'cat' : category, 'ph' : 'X', 'ts' : round(start, 1), 'dur' : round(duration, 1),
+				  'pid' : os.getpid(), 'tid' : thread.ident }
+		if args :
+			event['args'] = args
+		with self.lock :
+			self.events.append(event)
+			self.threads[thread.ident] = thread.name
+			total = self.totals.setdefault(( category, name ), { 'count' : 0, 'seconds' : 0.0, 'max' : 0.0 })
+			total['count'] += 1
+			total['seconds'] += duration / 1000000
+			total['max'] = max(total['max'], duration / 1000000)
+
+	## phase
+	#
+	# Time the body of a 'with' block
+	@contextlib.contextmanager
+	def phase(self, name, category = 'phase', **args) :
+		start = self.now()
+		try :
+			yield
+		finally :
+			self.record(category, name, start, self.now() - start, args)
+
+	## request
+	#
+	# Count one request to the server.  'seconds' is from sending it to having all of
+	# the body.
+	def request(self, method, url, status, seconds, size) :
+		endpoint = method.upper() + ' ' + endpointName(url)
+		duration = seconds * 1000000
+		self.record('request', endpoint, self.now() - duration, duration, { 'status' : status, 'bytes' : size })
+
+		milliseconds = seconds * 1000
+		bucket = next(( '<=' + str(limit) + 'ms' for limit in LATENCY_BUCKETS if milliseconds <= limit ), '>' + str(LATENCY_BUCKETS[-1]) + 'ms')
+		with self.lock :
+			stats = self.endpoints.get(endpoint)
+			if stats is None :
+				stats = { 'count' : 0, 'bytes' : 0, 'seconds' : 0.0, 'errors' : 0, 'latency' : {} }
+				self.endpoints[endpoint] = stats
+			stats['count'] += 1
+			stats['bytes'] += size
+			stats['seconds'] += seconds
+			if status != 200 :
+				stats['errors'] += 1
+			stats['latency'][bucket] = stats['latency'].get(bucket, 0) + 1
+
+	## summary
+	#
+	# The totals as a dictionary for the JSON summary
+	def summary(self) :
+		retval = { 'seconds' : round(self.now() / 1000000, 3), 'phases' : {}, 'handlers' : {}, 'endpoints' : {} }
+		with self.lock :
+			for ( category, name ), total in self.totals.items() :
+				section = { 'phase' : 'phases', 'handler' : 'handlers' }.get(category)
+				if section is not None :
+					retval[section][name] = { 'count' : total['count'], 'seconds' : round(total['seconds'], 4), 'max' : round(total['max'], 4) }
+			for endpoint, stats in sorted(self.endpoints.items()) :
+				latency = {}
+				for label in [ '<=' + str(limit) + 'ms' for limit in LATENCY_BUCKETS ] + [ '>' + str(LATENCY_BUCKETS[-1]) + 'ms' ] :
+					if label in stats['latency'] :
+						latency[label] = stats['latency'][label]
+				retval['endpoints'][endpoint] = { 'count'   : stats['count'],
+												  'bytes'   : stats['bytes'],
+												  'errors'  : stats['errors'],
+												  'seconds' : round(stats['seconds'], 4),
+												  'mean_ms' : round(stats['seconds'] * 1000 / stats['count'], 2),
+												  'latency' : latency }
+		return retval
+
+	## write
+	#
+	# Write the summary and the trace file, and return their names
+	def write(self, base) :
+		summary_file = base + '.json'
+		trace_file = base + '.trace.json'
+		with open(summary_file, 'w') as f :
+			json.dump(self.summary(), f, indent = 2)
+
+		with self.lock :
+			events = list(self.events)
+			for tid, name in self.threads.items() :
+				events.append({ 'name' : 'thread_name', 'ph' : 'M', 'pid' : os.getpid(), 'tid' : tid, 'args' : { 'name' : name } })
+		with open(trace_file, 'w') as f :
+			json.dump({ 'traceEvents' : events, 'displayTimeUnit' : 'ms' }, f)
+		return summary_file, trace_file
+
+## endpointName
+#
+# The path of a request URL below the API, with IDs replaced by '{id}' so requests to
+# the same endpoint are counted together
+def endpointName(url) :
+	path = urllib.parse.urlsplit(str(url)).path
+	for prefix in [ '/codedx/api', '/codedx/x' ] :
+		if path.startswith(prefix) :
+			path = path[len(prefix):]
+			break
+	return re.sub('/[0-9]+(?=/|$)', '/{id}', path)
+
+## start
+#
+# Start profiling this run
+def start() :
+	global current
+	current = Profile()
+	return current
+
+## phase
+#
+# Time a phase of the running profile.  Does nothing when there is none.
+def phase(name, category = 'phase', **args) :
+	if current is None :
+		return contextlib.nullcontext()
+	return current.phase(name, category, **args)
+
+## request
+#
+# Count a request in the running profile
+def request(method, url, status, seconds, size) :
+	if current is not None :
+		current.request(method, url, status, seconds, size)
+
+## responseHook
+#
+# A 'requests' response hook counting the requests of a session.  The response is read
+# here, as requests would read it next anyway, so its time and size are complete.
+# Streamed downloads are left to the code reading them, which knows when they end.
+def responseHook(resp, *args, **kwargs) :
+	if current is None or kwargs.get('stream') :
+		return
+	started = time.perf_counter()
+	size = len(resp.content)
+	seconds = resp.elapsed.total_seconds() + time.perf_counter() - started
+	current.request(resp.request.method, resp.url, resp.status_code, seconds, size)
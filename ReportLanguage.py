@@ -12,8 +12,10 @@ def languageCells(parms) :
 	parent = parms['parent']
 	parent.remove(parms['child'])
 	
-	# call Code Dx to get our metrics list
-	metrics = parms['cdx'].getCodeMetrics(parms['proj_id'])
+	# the metrics list collected with the summary, or call Code Dx to get it
+	metrics = parms['summary'].get('codeMetrics')
+	if metrics is None :
+		metrics = parms['cdx'].getCodeMetrics(parms['proj_id'])
 	
 	# get the parent XML item for this operation.
 	parent = parms['parent']
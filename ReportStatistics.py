@@ -0,0 +1,114 @@
+## Report Statistics Formatting
+#
+# The tables of the Finding Statistics section.  The numbers come from the columns of
+# FindingStatistics, built once per report on first use and kept in the call
+# parameters for the other tables.
+import xml.etree.ElementTree as ET
+import FindingStatistics
+
+# number of files listed in the finding density table
+TOP_FILES = 20
+
+CAT_LABELS = [ 'CAT I', 'CAT II', 'CAT III' ]
+
+## columns
+#
+# The finding columns of this report
+def columns(parms) :
+	if parms.get('statistics') is None :
+		parms['statistics'] = FindingStatistics.FindingColumns(parms['summary'])
+	return parms['statistics']
+
+## cell
+#
+# Add a bordered cell holding 'text' to a table row
+def cell(row, text, align = 'center') :
+	attrib = { 'border-width' : 'thin', 'border-style' : 'solid', 'text-align' : align }
+	if align == 'left' :
+		attrib['padding-left'] = '5pt'
+	tc = ET.SubElement(row, 'fo:table-cell', attrib)
+	bl = ET.SubElement(tc, 'fo:block')
+	bl.text = text
+	return tc
+
+## Tool CAT Cells
+#
+# One row per tool: its results in each CAT and in all
+def toolCatCells(parms) :
+	parent = parms['parent']
+	parent.remove(parms['child'])
+
+	stats = columns(parms)
+	matrix = stats.toolCatMatrix()
+	for index, tool in enumerate(stats.tools) :
+		row = ET.SubElement(parent, 'fo:table-row')
+		cell(row, tool, 'left')
+		for count in matrix[index] :
+			cell(row, str(int(count)))
+		cell(row, str(int(matrix[index].sum())))
+
+## File Density Cells
+#
+# One row per file, for the files with the most findings
+def fileDensityCells(parms) :
+	parent = parms['parent']
+	parent.remove(parms['child'])
+
+	for path, findings, by_cat in columns(parms).fileDensity(TOP_FILES) :
+		row = ET.SubElement(parent, 'fo:table-row')
+		cell(row, path, 'left')
+		cell(row, str(findings))
+		for count in by_cat :
+			cell(row, str(count))
+
+## Tool Overlap Table
+#
+# A table with a row and a column per tool.  Each cell is the number of distinct
+# findings both tools reported; the diagonal is each tool's own count.  The columns
+# depend on the tools, so the whole table is written here.
+def toolOverlapTable(parms) :
+	parent = parms['parent']
+	parent.remove(parms['child'])
+
+	stats = columns(parms)
+	if len(stats.tools) == 0 :
+		return
+	overlap = stats.toolOverlap()
+
+	table = ET.SubElement(parent, 'fo:table', { 'text-align' : 'center', 'table-layout' : 'fixed', 'width' : '100%', 'border-collapse' : 'collapse' })
+	ET.SubElement(table, 'fo:table-column', { 'column-width' : '25%' })
+	width = str(round(75 / len(stats.tools), 2)) + '%'
+	for tool in stats.tools :
+		ET.SubElement(table, 'fo:table-column', { 'column-width' : width })
+	body = ET.SubElement(table, 'fo:table-body', { 'font-size' : '10pt' })
+
+	row = ET.SubElement(body, 'fo:table-row', { 'background-color' : 'LightSkyBlue' })
+	cell(row, 'Tool Name')
+	for tool in stats.tools :
+		cell(row, tool)
+
+	for index, tool in enumerate(stats.tools) :
+		row = ET.SubElement(body, 'fo:table-row')
+		cell(row, tool, 'left')
+		for count in overlap[index] :
+			cell(row, str(int(count)))
+
+## STIG Tool Coverage Cells
+#
+# One row per STIG: its findings, how many of the tools reported any of them, and the
+# results of each of those tools
+def stigToolCoverageCells(parms) :
+	parent = parms['parent']
+	parent.remove(parms['child'])
+
+	stats = columns(parms)
+	coverage, findings = stats.stigToolCoverage()
+	for index, ( cat, stig_name ) in enumerate(stats.stigs) :
+		reporting = [ stats.tools[tool] + " (" + str(int(coverage[index, tool])) + ")" for tool in coverage[index].nonzero()[0] ]
+
+		row = ET.SubElement(parent, 'fo:table-row')
+		cell(row, stig_name, 'left')
+		cell(row, CAT_LABELS[cat])
+		cell(row, str(int(findings[index])))
+		cell(row, str(len(reporting)) + " of " + str(len(stats.tools)))
+		cell(row, ", ".join(reporting), 'left')
@@ -0,0 +1,152 @@
+## Code Dx Response Cache
+#
+# Keeps the JSON responses from the Code Dx server on disk so a report can be run again
+# without asking the server for data it has already returned.  Each response is stored
+# in its own file, named by a hash of the request.
+#
+# Project queries include the project's latest analysis ID in their key.  Once a new
+# analysis lands, the old entries are simply never asked for again and age out through
+# the size limit.  Server wide queries (projects, standards) have no analysis to tie
+# them to, so they are kept for a limited number of seconds instead.
+#
+# The cache is shared by the collection threads.  Files are written under a temporary
+# name and renamed into place so a reader never sees a partial entry.
+import hashlib
+import json
+import os
+import threading
+import time
+
+class ResponseCache :
+	## Constructor
+	#
+	# The mode is one of:
+	#	'use'     - read entries and store new responses (the default)
+	#	'refresh' - ignore existing entries, but store the new responses
+	#	'off'     - the cache is not touched at all
+	def __init__(self, directory, max_bytes, max_age, mode = 'use') :
+		self.directory = directory
+		self.maxBytes  = max_bytes
+		self.maxAge    = max_age
+		self.mode      = mode
+		self.hits      = 0
+		self.misses    = 0
+		self.size      = None	# bytes on disk, counted on the first store
+		self.lock      = threading.Lock()
+
+		if self.mode != 'off' :
+			os.makedirs(self.directory, exist_ok = True)
+
+	## key
+	#
+	# Form the key for a request.  Returns None when the request should not be cached.
+	def key(self, endpoint, project_id = None, body = None, analysis_id = None) :
+		if self.mode == 'off' :
+			return None
+
+		text = json.dumps([ endpoint, project_id, body, analysis_id ], sort_keys = True)
+		return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+	## path
+	#
+	# Location of the file for a key
+	def path(self, key) :
+		return os.path.join(self.directory, key + '.json')
+
+	## get
+	#
+	# Return the stored response for the key, or None on a miss.  When 'max_age' is
+	# True the entry must also be younger than the configured age.
+	def get(self, key, max_age = False) :
+		if key is None :
+			return None
+
+		path = self.path(key)
+		data = None
+		if self.mode == 'use' :
+			try :
+				if max_age and ( time.time() - os.path.getmtime(path) > self.maxAge ) :
+					raise OSError("cache entry expired")
+				with open(path, 'r') as f :
+					data = json.load(f)
+
+				# mark the entry as recently used.  The access time is what eviction
+				# orders on; the modified time still records when it was stored
+				os.utime(path, (time.time(), os.path.getmtime(path)))
+			except (OSError, ValueError) :
+				data = None
+
+		with self.lock :
+			if data is None :
+				self.misses += 1
+			else :
+				self.hits += 1
+		return data
+
+	## put
+	#
+	# Store a response under the key, then evict old entries if we are over the limit
+	def put(self, key, data) :
+		if key is None :
+			return
+
+		path = self.path(key)
+		temp = path + '.' + str(threading.get_ident()) + '.tmp'
+		try :
+			with open(temp, 'w') as f :
+				json.dump(data, f)
+			written = os.path.getsize(temp)
+			os.replace(temp, path)
+		except OSError as e :
+			print("|-- [ResponseCache put] could not store entry: " + str(e))
+			return
+
+		with self.lock :
+			if self.size is None :
+				self.size = self.diskUsage()
+			else :
+				self.size += written
+			if self.size > self.maxBytes :
+				self.evict()
+
+	## diskUsage
+	#
+	# Total size of the entries in the cache directory
+	def diskUsage(self) :
+		total = 0
+		for entry in os.scandir(self.directory) :
+			if entry.name.endswith('.json') :
+				total += entry.stat().st_size
+		return total
+
+	## evict
+	#
+	# Remove the least recently used entries until the cache is back to 90% of its limit.
+	# The lock is held by the caller.
+	def evict(self) :
+		entries = []
+		for entry in os.scandir(self.directory) :
+			if entry.name.endswith('.json') :
+				stat = entry.stat()
+				entries.append(( stat.st_atime, stat.st_size, entry.path ))
+		entries.sort()
+
+		self.size = sum(size for atime, size, path in entries)
+		target = self.maxBytes * 0.9
+		for atime, size, path in entries :
+			if self.size <= target :
+				break
+			try :
+				os.remove(path)
+				self.size -= size
+			except OSError :
+				pass
+
+	## report
+	#
+	# Print the hit and miss counts for this run
+	def report(self) :
+		if self.mode == 'off' :
+			print("|- Response cache disabled")
+			return
+		print("|- Response cache hits = " + str(self.hits) + ", misses = " + str(self.misses))
@@ -0,0 +1,276 @@
+## Source File Store
+#
+# Keeps the source files downloaded for code snippets in a spool directory on disk.
+# Holding a whole file as a list of lines, only to cut a few lines out of it, made large
+# (generated) sources very expensive.  Instead each file is written to the spool as it
+# downloads, and the offset of every line start is recorded in a compact index next to
+# it.  A snippet maps the file into memory and decodes just the bytes of its lines.
+#
+# Files are kept between runs, keyed by project, file ID and the project's latest
+# analysis, so a repeat report does not download its sources again.  The spool is
+# bounded in size; the least recently used files are removed first.  As with the
+# response cache, files are written under a temporary name and renamed into place.
+#
+# Each spooled file has two parts:
+#	<key>.src - the file as sent by the server
+#	<key>.idx - the text encoding, a newline, then the line start offsets as 64 bit
+#	            integers in machine order
+import array
+import collections
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+## SourceWriter
+#
+# Writes one file into the spool a piece at a time, building the line index as the
+# pieces arrive.  'commit' puts the file in place once it is complete.
+class SourceWriter :
+	def __init__(self, store, key, encoding) :
+		self.store    = store
+		self.key      = key
+		self.encoding = encoding
+		self.offsets  = array.array('Q', [ 0 ])
+		self.size     = 0
+		self.temp     = store.path(key) + '.' + str(threading.get_ident()) + '.tmp'
+		self.file     = open(self.temp, 'wb')
+
+	## write
+	#
+	# Add the next piece of the file
+	def write(self, chunk) :
+		self.file.write(chunk)
+		start = self.size
+		pos = chunk.find(b'\n')
+		while pos >= 0 :
+			self.offsets.append(start + pos + 1)
+			pos = chunk.find(b'\n', pos + 1)
+		self.size += len(chunk)
+
+	## commit
+	#
+	# Finish the file and its index, and hand them to the store.  Returns the file size.
+	def commit(self) :
+		self.file.close()
+		path = self.store.path(self.key)
+		with open(self.temp + '.idx', 'wb') as f :
+			f.write(self.encoding.encode('ascii') + b'\n')
+			self.offsets.tofile(f)
+		os.replace(self.temp + '.idx', path + '.idx')
+		os.replace(self.temp, path + '.src')
+		self.store.stored(self.key, self.offsets, self.encoding, self.size)
+		return self.size
+
+	## discard
+	#
+	# Abandon a partly written file
+	def discard(self) :
+		self.file.close()
+		for temp in [ self.temp, self.temp + '.idx' ] :
+			try :
+				os.remove(temp)
+			except OSError :
+				pass
+
+class SourceStore :
+	## Constructor
+	#
+	# The mode follows the response cache:
+	#	'use'     - reuse spooled files from earlier runs (the default)
+	#	'refresh' - download every file again, and spool it for the next run
+	#	'off'     - spool into a temporary directory that is removed when done
+	def __init__(self, directory, max_bytes, mode = 'use') :
+		self.maxBytes = max_bytes
+		self.mode     = mode
+		self.size     = None	# bytes on disk, counted on the first store
+		self.lock     = threading.Lock()
+		self.written  = set()	# keys spooled during this run
+		self.reused   = 0
+
+		# line indexes of the files used most recently.  Snippets are collected one
+		# file at a time, so only a few are needed
+		self.indexes  = collections.OrderedDict()
+		self.indexLimit = 32
+
+		# without a known analysis a file may not be reused by a later run.  Those
+		# keys are tied to this run instead
+		self.runId = uuid.uuid4().hex
+
+		self.temporary = None
+		if self.mode == 'off' :
+			self.temporary = tempfile.TemporaryDirectory(prefix = 'cdx-sources-')
+			directory = self.temporary.name
+		self.directory = directory
+		os.makedirs(self.directory, exist_ok = True)
+
+	## key
+	#
+	# Form the key of a source file
+	def key(self, project_id, fileid, analysis_id) :
+		if analysis_id is None :
+			analysis_id = self.runId
+		text = json.dumps([ 'source', project_id, fileid, analysis_id ])
+		return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+	## path
+	#
+	# Location of the files for a key, without the extension
+	def path(self, key) :
+		return os.path.join(self.directory, key)
+
+	## has
+	#
+	# Return True if the file for the key is in the spool and may be used
+	def has(self, key) :
+		with self.lock :
+			if key in self.written :
+				return True
+		if self.mode != 'use' :
+			return False
+
+		path = self.path(key)
+		try :
+			# mark the file as recently used, as the response cache does
+			now = time.time()
+			os.utime(path + '.src', (now, os.path.getmtime(path + '.src')))
+			os.utime(path + '.idx', (now, os.path.getmtime(path + '.idx')))
+		except OSError :
+			return False
+
+		with self.lock :
+			self.written.add(key)
+			self.reused += 1
+		return True
+
+	## writer
+	#
+	# Start spooling the file for a key
+	def writer(self, key, encoding) :
+		return SourceWriter(self, key, encoding)
+
+	## stored
+	#
+	# Record a file the writer has put in place, then evict old files if we are over
+	# the limit
+	def stored(self, key, offsets, encoding, size) :
+		with self.lock :
+			self.written.add(key)
+			self.remember(key, ( offsets, encoding ))
+			if self.size is None :
+				self.size = self.diskUsage()
+			else :
+				self.size += size + offsets.itemsize * len(offsets)
+			if self.size > self.maxBytes :
+				self.evict()
+
+	## remember
+	#
+	# Keep a line index in memory.  The lock is held by the caller.
+	def remember(self, key, index) :
+		self.indexes[key] = index
+		self.indexes.move_to_end(key)
+		while len(self.indexes) > self.indexLimit :
+			self.indexes.popitem(last = False)
+
+	## index
+	#
+	# Return the line offsets and text encoding of a spooled file
+	def index(self, key) :
+		with self.lock :
+			if key in self.indexes :
+				self.indexes.move_to_end(key)
+				return self.indexes[key]
+
+		with open(self.path(key) + '.idx', 'rb') as f :
+			encoding = f.readline().decode('ascii').strip()
+			data = f.read()
+		offsets = array.array('Q')
+		offsets.frombytes(data)
+
+		with self.lock :
+			self.remember(key, ( offsets, encoding ))
+		return offsets, encoding
+
+	## snippet
+	#
+	# Cut the 'count' lines either side of 'line' out of a spooled file, as one string.
+	# The lines are chosen as a slice of the file's list of lines would choose them,
+	# and each has its trailing white space removed.
+	def snippet(self, key, line, count) :
+		offsets, encoding = self.index(key)
+		loc = int(line)
+		count = int(count)
+		lines = range(len(offsets))[loc - count : loc + count]
+		if len(lines) == 0 :
+			return ''
+
+		path = self.path(key) + '.src'
+		start = offsets[lines[0]]
+		end = os.path.getsize(path)
+		if lines[-1] + 1 < len(offsets) :
+			end = offsets[lines[-1] + 1] - 1
+		if end <= start :
+			data = b''
+		else :
+			with open(path, 'rb') as f :
+				with mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as mapped :
+					data = mapped[start : end]
+
+		retval = ''
+		for text in data.decode(encoding, errors = 'replace').split('\n') :
+			retval += text.rstrip() + '\n'
+		return retval
+
+	## diskUsage
+	#
+	# Total size of the files in the spool
+	def diskUsage(self) :
+		total = 0
+		for entry in os.scandir(self.directory) :
+			if entry.name.endswith('.src') or entry.name.endswith('.idx') :
+				total += entry.stat().st_size
+		return total
+
+	## evict
+	#
+	# Remove the least recently used files until the spool is back to 90% of its limit.
+	# Files written or reused by this run are kept.  The lock is held by the caller.
+	def evict(self) :
+		entries = []
+		self.size = 0
+		for entry in os.scandir(self.directory) :
+			if entry.name.endswith('.src') :
+				key = entry.name[: -len('.src')]
+				stat = entry.stat()
+				try :
+					size = stat.st_size + os.path.getsize(self.path(key) + '.idx')
+				except OSError :
+					size = stat.st_size
+				self.size += size
+				if not key in self.written :
+					entries.append(( stat.st_atime, size, key ))
+		entries.sort()
+
+		target = self.maxBytes * 0.9
+		for atime, size, key in entries :
+			if self.size <= target :
+				break
+			for extension in [ '.src', '.idx' ] :
+				try :
+					os.remove(self.path(key) + extension)
+				except OSError :
+					pass
+			self.size -= size
+
+	## close
+	#
+	# Remove a temporary spool
+	def close(self) :
+		if self.temporary is not None :
+			self.temporary.cleanup()
+			self.temporary = None
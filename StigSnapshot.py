@@ -0,0 +1,103 @@
+## STIG Snapshot
+#
+# Incremental collection.  After a run, the findings (with their code snippets) of every
+# STIG are saved along with the STIG's count from the grouped counts and the project's
+# latest analysis.  The next run of the same project fetches fresh grouped counts, and
+# while the latest analysis is still the snapshot's, only collects the STIGs whose count
+# has changed (a finding triaged as fixed or false positive, say).  The others take
+# their findings straight from the snapshot, with no findings queries and no source
+# downloads.
+#
+# A new analysis can fix one finding of a STIG and add another, leaving its count as it
+# was, and can move the code around a finding.  So after a new analysis, or when the
+# latest analysis is unknown, every STIG is collected again.  A snapshot is also only
+# used while the STIG standard and the snippet size are the ones it was taken with.
+#
+# Snapshots are pickled into the cache directory, one per project, and written under a
+# temporary name first.  They are read back with the unpickler of SummarySnapshot, which
+# refuses every class but the finding records.
+import hashlib
+import json
+import os
+import pickle
+import sys
+import SummarySnapshot
+
+# bump when the pickled layout changes
+FORMAT_VERSION = 1
+
+## snapshotPath
+#
+# Where the snapshot for a project on a server is kept
+def snapshotPath(cache_dir, server, project_id) :
+	text = json.dumps([ 'snapshot', server, project_id ])
+	name = hashlib.sha256(text.encode('utf-8')).hexdigest()
+	return os.path.join(cache_dir, 'snapshots', name + '.pickle')
+
+## load
+#
+# Return the snapshot at 'path', or None if there is none, it was written by another
+# version of the report, or it holds anything but the snapshot's own data
+def load(path) :
+	try :
+		with open(path, 'rb') as f :
+			snapshot = SummarySnapshot.SnapshotUnpickler(f).load()
+	except Exception :
+		return None
+
+	if snapshot.get('format') != FORMAT_VERSION or snapshot.get('python') != sys.version_info[:2] :
+		return None
+	return snapshot
+
+## reuse
+#
+# Fill the 'findings' of every STIG the snapshot still holds, and put those findings in
+# the store.  'analysis_id' is the project's latest analysis; a snapshot of any other is
+# not used.  Returns the STIGs left to collect, as one dictionary per 'cat' in the order
+# of 'in_cats', and the number of STIGs reused.
+def reuse(snapshot, in_cats, store, analysis_id, countBy, code_linecount) :
+
+	pending = [ dict(in_cat) for in_cat in in_cats ]
+	if snapshot is None or analysis_id is None or snapshot['analysis'] != analysis_id :
+		return pending, 0
+	if snapshot['countBy'] != countBy or snapshot['code_linecount'] != str(code_linecount) :
+		return pending, 0
+
+	reused = 0
+	for in_cat, todo in zip(in_cats, pending) :
+		for key, cat in in_cat.items() :
+			saved = snapshot['stigs'].get(cat['filter_id'])
+			if saved is None or saved['fcount'] != cat['fcount'] :
+				continue
+			cat['findings'] = list(saved['findings'])
+			for id in saved['findings'] :
+				store.keep(snapshot['findings'][id])
+			del todo[key]
+			reused += 1
+	return pending, reused
+
+## save
+#
+# Write the snapshot of this run, and the analysis it was taken from
+def save(path, in_cats, store, analysis_id, countBy, code_linecount) :
+
+	stigs = {}
+	for in_cat in in_cats :
+		for cat in in_cat.values() :
+			stigs[cat['filter_id']] = { 'fcount' : cat['fcount'], 'findings' : cat['findings'] }
+
+	snapshot = { 'format'         : FORMAT_VERSION,
+				 'python'         : sys.version_info[:2],
+				 'analysis'       : analysis_id,
+				 'countBy'        : countBy,
+				 'code_linecount' : str(code_linecount),
+				 'stigs'          : stigs,
+				 'findings'       : { finding.id : finding for finding in store } }
+	temp = path + '.' + str(os.getpid()) + '.tmp'
+	try :
+		os.makedirs(os.path.dirname(path), exist_ok = True)
+		with open(temp, 'wb') as f :
+			pickle.dump(snapshot, f, pickle.HIGHEST_PROTOCOL)
+		os.replace(temp, path)
+	except OSError as e :
+		print("|-- [StigSnapshot] could not save snapshot: " + str(e))
@@ -0,0 +1,94 @@
+## Summary Snapshot
+#
+# Saves everything a report was built from (the 'summary_data' of FindingsAndTools.get:
+# STIGs, findings with their code snippets, tools and language metrics) to one file, so
+# the report can be written again without the Code Dx server.  Change the template, or
+# take the file to another machine, and run the report with --from-snapshot.
+#
+# The file is:
+#
+#	magic      8 bytes   b'CDXSNAP\0'
+#	version    2 bytes   big endian, FORMAT_VERSION
+#	length     4 bytes   big endian, length of the header
+#	header     JSON      project name and ID, when it was taken, finding count
+#	body       zlib compressed pickle of the summary data
+#
+# The body is unpickled with only the finding record classes allowed, so a snapshot
+# cannot run code when it is loaded.
+import datetime
+import io
+import json
+import pickle
+import struct
+import zlib
+import FindingRecord
+
+MAGIC = b'CDXSNAP\0'
+
+# bump when the layout of the file or of the summary data changes
+FORMAT_VERSION = 1
+
+# the fixed protocol keeps snapshots readable by every Python the report runs on
+PICKLE_PROTOCOL = 4
+
+# the only classes a snapshot may contain
+ALLOWED = { ( 'FindingRecord', 'FindingStore' ) : FindingRecord.FindingStore,
+			( 'FindingRecord', 'Finding' )      : FindingRecord.Finding,
+			( 'FindingRecord', 'Location' )     : FindingRecord.Location,
+			( 'FindingRecord', 'ToolResult' )   : FindingRecord.ToolResult }
+
+## SnapshotUnpickler
+#
+# An unpickler that refuses every class but the finding records
+class SnapshotUnpickler(pickle.Unpickler) :
+	def find_class(self, module, name) :
+		if ( module, name ) in ALLOWED :
+			return ALLOWED[( module, name )]
+		raise pickle.UnpicklingError("snapshot may not contain " + module + "." + name)
+
+## save
+#
+# Write the summary data of a project to 'filename'
+def save(filename, project_name, project_id, summary) :
+
+	header = { 'project'    : project_name,
+			   'project_id' : project_id,
+			   'created'    : datetime.datetime.now().isoformat(timespec = 'seconds'),
+			   'findings'   : len(summary['findings']) }
+	header = json.dumps(header).encode('utf-8')
+	body = zlib.compress(pickle.dumps(summary, PICKLE_PROTOCOL))
+
+	with open(filename, 'wb') as f :
+		f.write(MAGIC)
+		f.write(struct.pack('>HI', FORMAT_VERSION, len(header)))
+		f.write(header)
+		f.write(body)
+	print("|- Saved snapshot \"" + filename + "\" (" + str(len(body)) + " bytes)")
+
+## load
+#
+# Read a snapshot written by save.  Returns the header and the summary data.
+def load(filename) :
+
+	with open(filename, 'rb') as f :
+		data = f.read()
+
+	if data[: len(MAGIC)] != MAGIC :
+		print("|- ERROR: \"" + filename + "\" is not a report snapshot")
+		raise ValueError("not a report snapshot")
+	version, length = struct.unpack_from('>HI', data, len(MAGIC))
+	if version != FORMAT_VERSION :
+		print("|- ERROR: snapshot \"" + filename + "\" is format " + str(version) + ", this report reads format " + str(FORMAT_VERSION))
+		raise ValueError("unsupported snapshot version")
+
+	start = len(MAGIC) + struct.calcsize('>HI')
+	header = json.loads(data[start : start + length].decode('utf-8'))
+	try :
+		body = zlib.decompress(data[start + length :])
+		summary = SnapshotUnpickler(io.BytesIO(body)).load()
+	except (zlib.error, pickle.UnpicklingError, EOFError) as e :
+		print("|- ERROR: snapshot \"" + filename + "\" could not be read: " + str(e))
+		raise ValueError("damaged snapshot")
+
+	print("|- Loaded snapshot of " + header['project'] + " taken " + header['created'])
+	return header, summary
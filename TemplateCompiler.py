@@ -0,0 +1,191 @@
+## Report Template Compiler
+#
+# The report template is an Apache FO file with <CodeDx content="..."/> placeholders.
+# Compiling it parses the file once and records a slot for every placeholder: the path
+# to its parent element, its position under that parent, and its 'content' attribute.
+# Filling in the report is then one pass over the slots, rather than searching the tree
+# for the placeholders (and their parents) on every run.
+#
+# The compiled template is kept in memory for the rest of the run, so several projects
+# can be reported from it, and pickled to disk so later runs skip the parse.  The disk
+# copy is used while the template file's modification time and size are unchanged.  If
+# they have changed, the file is hashed and the copy is still used if the contents are
+# the same.  The disk copy is read back with an unpickler that refuses every class but
+# the compiled template and its elements, as snapshots are, so a planted cache file
+# cannot run code; it is simply compiled again.
+#
+#	template = TemplateCompiler.load('template.fo', '.cdxcache')
+#	tree, slots = template.instantiate()
+#	for parent, child, content in slots :
+#		...
+import copy
+import hashlib
+import os
+import pickle
+import sys
+import threading
+import xml.etree.ElementTree as ET
+
+# bump when the pickled layout changes
+FORMAT_VERSION = 1
+
+# compiled templates already loaded during this run, by absolute path
+compiled = {}
+compiledLock = threading.Lock()
+
+class CompiledTemplate :
+	## Constructor
+	#
+	# 'root' is the parsed template.  Each slot is ( parent path, child index, content ),
+	# where the parent path is the list of child indexes leading from the root to the
+	# placeholder's parent.
+	def __init__(self, root, slots) :
+		self.root  = root
+		self.slots = slots
+
+	## instantiate
+	#
+	# Return a fresh copy of the template to fill in, and its slots resolved to elements
+	# as ( parent, child, content ).  The slots are in the order the report has always
+	# filled them: parents in the order of their first placeholder, then each parent's
+	# placeholders in document order.
+	def instantiate(self) :
+		root = copy.deepcopy(self.root)
+		slots = []
+		for path, index, content in self.slots :
+			parent = root
+			for step in path :
+				parent = parent[step]
+			slots.append(( parent, parent[index], content ))
+		return ET.ElementTree(root), slots
+
+## compileTemplate
+#
+# Parse the template and record its slots in a single walk of the tree
+def compileTemplate(template_file) :
+
+	root = ET.parse(template_file).getroot()
+
+	# walk the tree in document order, keeping the path to each element.  Placeholders
+	# are grouped under their direct parent
+	by_parent = {}
+	stack = [ ( root, [] ) ]
+	while len(stack) > 0 :
+		elem, path = stack.pop()
+		for index, child in enumerate(elem) :
+			if child.tag == 'CodeDx' :
+				by_parent.setdefault(tuple(path), []).append(( index, child.attrib['content'] ))
+
+		# children are pushed in reverse so they are visited in document order
+		for index in range(len(elem) - 1, -1, -1) :
+			stack.append(( elem[index], path + [ index ] ))
+
+	# dictionaries keep their insertion order, which is the order the parents were found
+	slots = []
+	for path, children in by_parent.items() :
+		for index, content in children :
+			slots.append(( list(path), index, content ))
+
+	return CompiledTemplate(root, slots)
+
+## fileHash
+#
+# SHA-256 of the template file
+def fileHash(template_file) :
+	digest = hashlib.sha256()
+	with open(template_file, 'rb') as f :
+		for block in iter(lambda : f.read(65536), b'') :
+			digest.update(block)
+	return digest.hexdigest()
+
+## cachePath
+#
+# Where the compiled copy of a template is kept in the cache directory
+def cachePath(template_file, cache_dir) :
+	name = hashlib.sha256(os.path.abspath(template_file).encode('utf-8')).hexdigest()
+	return os.path.join(cache_dir, 'templates', name + '.pickle')
+
+## TemplateUnpickler
+#
+# An unpickler that refuses every class but the compiled template and its elements
+class TemplateUnpickler(pickle.Unpickler) :
+	def find_class(self, module, name) :
+		if ( module, name ) == ( __name__, 'CompiledTemplate' ) :
+			return CompiledTemplate
+		if ( module, name ) == ( 'xml.etree.ElementTree', 'Element' ) :
+			return ET.Element
+		raise pickle.UnpicklingError("compiled template may not contain " + module + "." + name)
+
+## readCache
+#
+# Return the compiled template from the disk cache if it is still current, else None
+def readCache(path, template_file, stat) :
+	try :
+		with open(path, 'rb') as f :
+			entry = TemplateUnpickler(f).load()
+	except Exception :
+		return None
+
+	if not isinstance(entry, dict) or not isinstance(entry.get('template'), CompiledTemplate) :
+		return None
+	if entry.get('format') != FORMAT_VERSION or entry.get('python') != sys.version_info[:2] :
+		return None
+
+	# unchanged file.  Otherwise the contents decide
+	if entry['mtime'] == stat.st_mtime_ns and entry['size'] == stat.st_size :
+		return entry['template']
+	if entry['sha256'] != fileHash(template_file) :
+		return None
+
+	# same contents with a new time (a fresh checkout, say).  Record the new time
+	writeCache(path, entry['template'], entry['sha256'], stat)
+	return entry['template']
+
+## writeCache
+#
+# Store a compiled template on disk, under a temporary name first
+def writeCache(path, template, sha256, stat) :
+	entry = { 'format'   : FORMAT_VERSION,
+			  'python'   : sys.version_info[:2],
+			  'mtime'    : stat.st_mtime_ns,
+			  'size'     : stat.st_size,
+			  'sha256'   : sha256,
+			  'template' : template }
+	temp = path + '.' + str(os.getpid()) + '.tmp'
+	try :
+		os.makedirs(os.path.dirname(path), exist_ok = True)
+		with open(temp, 'wb') as f :
+			pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+		os.replace(temp, path)
+	except OSError as e :
+		print("|-- [TemplateCompiler] could not store compiled template: " + str(e))
+
+## load
+#
+# Return the compiled template for a template file.  It comes from memory if it was
+# loaded earlier in this run, from the disk cache in 'cache_dir' if that is current, or
+# is compiled (and cached) otherwise.  A 'cache_dir' of None skips the disk cache.
+def load(template_file, cache_dir = None) :
+
+	key = os.path.abspath(template_file)
+	stat = os.stat(template_file)
+	with compiledLock :
+		if key in compiled :
+			mtime, size, template = compiled[key]
+			if mtime == stat.st_mtime_ns and size == stat.st_size :
+				return template
+
+		template = None
+		path = None
+		if cache_dir is not None :
+			path = cachePath(template_file, cache_dir)
+			template = readCache(path, template_file, stat)
+
+		if template is None :
+			print("|-- [TemplateCompiler] compiling \"" + template_file + "\"")
+			template = compileTemplate(template_file)
+			if path is not None :
+				writeCache(path, template, fileHash(template_file), stat)
+
+		compiled[key] = ( stat.st_mtime_ns, stat.st_size, template )
+		return template
@@ -0,0 +1,275 @@
+#!/usr/bin/python
+## Report Benchmark
+#
+# Runs 'report.main' against the mock Code Dx server (bench/mockserver.py) for projects
+# of increasing size, and records for each phase of the report:
+#
+#	seconds  - wall time spent in the phase
+#	requests - requests the mock server answered during the phase
+#	bytes    - bytes the mock server sent during the phase
+#	rss_mb   - peak resident memory of the report process at the end of the phase
+#
+# as well as the total time and the size of the FO file written.  Each project runs in
+# a fresh child process so the peak memory of one run does not hide the next.
+#
+# The phases are timed by wrapping the functions 'report.main' calls:
+#
+#	connect  - creating the CodeDx client (the project list)
+#	collect  - FindingsAndTools.get (standards, findings, code snippets)
+#	chart    - ExecutiveSummary.FormatExecutiveGraphic
+#	template - loading the compiled FO template
+#	render   - filling in the <CodeDx> placeholders
+#	write    - writing the FO file
+#
+# Results are written as JSON.  Given the results of an earlier run with '--baseline',
+# any phase that got slower (or bigger) than the tolerance allows is reported and the
+# benchmark exits with status 1, so it can gate a release.
+#
+#	python bench/benchmark.py --sizes 100,1000,10000 --latency 0.005 --output results.json
+#	python bench/benchmark.py --baseline results.json
+import argparse
+import configparser
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPORT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, REPORT_DIR)
+
+import mockserver
+
+PHASES = [ 'connect', 'collect', 'chart', 'template', 'render', 'write' ]
+
+## serverStats
+#
+# Read the request and byte counters from the mock server
+def serverStats(url) :
+	with urllib.request.urlopen(url + '/__stats') as resp :
+		return json.loads(resp.read().decode('utf-8'))
+
+## peakRss
+#
+# Peak resident memory of this process in megabytes (ru_maxrss is in kilobytes on Linux)
+def peakRss() :
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+## PhaseTimer
+#
+# Records each phase as it starts and finishes.  The time between the end of one
+# wrapped call and the start of the next belongs to 'render', which is everything
+# 'report.main' does itself once the template is loaded.
+class PhaseTimer :
+	def __init__(self, server_url) :
+		self.url = server_url
+		self.phases = {}
+		self.mark = None
+
+	def begin(self) :
+		return ( time.monotonic(), serverStats(self.url) )
+
+	def end(self, name, start) :
+		began, before = start
+		after = serverStats(self.url)
+		phase = self.phases.setdefault(name, { 'seconds' : 0.0, 'requests' : 0, 'bytes' : 0, 'rss_mb' : 0.0 })
+		phase['seconds'] += time.monotonic() - began
+		phase['requests'] += after['requests'] - before['requests']
+		phase['bytes'] += after['bytes'] - before['bytes']
+		phase['rss_mb'] = max(phase['rss_mb'], peakRss())
+
+	## wrap
+	#
+	# Return 'function' timed as phase 'name'
+	def wrap(self, name, function) :
+		def timed(*args, **kwargs) :
+			start = self.begin()
+			try :
+				return function(*args, **kwargs)
+			finally :
+				self.end(name, start)
+		return timed
+
+## runChild
+#
+# Run one report in this process and write the measurements to 'result_file'
+def runChild(args) :
+	import codedx
+	import FindingsAndTools
+	import ExecutiveSummary
+	import report
+	import TemplateCompiler
+
+	server_url = 'http://127.0.0.1:' + str(args.port)
+	timer = PhaseTimer(server_url)
+	codedx.CodeDx = timer.wrap('connect', codedx.CodeDx)
+	FindingsAndTools.get = timer.wrap('collect', FindingsAndTools.get)
+	ExecutiveSummary.FormatExecutiveGraphic = timer.wrap('chart', ExecutiveSummary.FormatExecutiveGraphic)
+	TemplateCompiler.load = timer.wrap('template', TemplateCompiler.load)
+	report.writeFo = timer.wrap('write', report.writeFo)
+
+	report_args = argparse.Namespace(config = args.config, no_cache = not args.cache, refresh = False, pdf = False, projects = None, profile = None,
+									 save_snapshot = None, from_snapshot = None, from_export = None)
+	start = timer.begin()
+	os.chdir(REPORT_DIR)
+	report.main(report_args)
+	timer.end('total', start)
+
+	# whatever the wrapped phases did not account for was spent filling in the template
+	total = timer.phases.pop('total')
+	render = { 'seconds'  : total['seconds'] - sum(phase['seconds'] for phase in timer.phases.values()),
+			   'requests' : total['requests'] - sum(phase['requests'] for phase in timer.phases.values()),
+			   'bytes'    : total['bytes'] - sum(phase['bytes'] for phase in timer.phases.values()),
+			   'rss_mb'   : total['rss_mb'] }
+	timer.phases['render'] = render
+
+	ini = configparser.ConfigParser()
+	ini.read(args.config)
+	result = { 'phases'   : timer.phases,
+			   'seconds'  : total['seconds'],
+			   'requests' : total['requests'],
+			   'rss_mb'   : total['rss_mb'],
+			   'fo_bytes' : os.path.getsize(ini.get('Report', 'fo_output')) }
+	with open(args.result, 'w') as f :
+		json.dump(result, f, indent = 1)
+
+## writeConfig
+#
+# Write the report configuration for one benchmark project.  Settings given with
+# '--set Section.key=value' override the defaults here.
+def writeConfig(path, workdir, port, project, overrides) :
+	ini = configparser.ConfigParser()
+	ini['CodeDx'] = { 'transport' : 'http',
+					  'server'    : '127.0.0.1',
+					  'port'      : str(port),
+					  'project'   : project,
+					  'api-key'   : 'benchmark',
+					  'cache_dir' : os.path.join(workdir, 'cache') }
+	ini['Report'] = { 'graphic_filename' : os.path.join(workdir, project + '.png'),
+					  'template'         : os.path.join(REPORT_DIR, 'template.fo'),
+					  'fo_output'        : os.path.join(workdir, project + '.fo'),
+					  'code_detail'      : '5' }
+	for override in overrides :
+		key, value = override.split('=', 1)
+		section, option = key.split('.', 1)
+		if not ini.has_section(section) :
+			ini.add_section(section)
+		ini.set(section, option, value)
+	with open(path, 'w') as f :
+		ini.write(f)
+
+## compare
+#
+# Compare results against a baseline.  Returns the list of regressions found.
+def compare(results, baseline, tolerance) :
+	regressions = []
+	for project, result in results.items() :
+		if not project in baseline :
+			continue
+		old = baseline[project]
+		checks = [ ( 'total seconds', old['seconds'], result['seconds'] ),
+				   ( 'total requests', old['requests'], result['requests'] ),
+				   ( 'peak rss_mb', old['rss_mb'], result['rss_mb'] ),
+				   ( 'fo_bytes', old['fo_bytes'], result['fo_bytes'] ) ]
+		for name in PHASES :
+			if name in old['phases'] and name in result['phases'] :
+				checks.append(( name + ' seconds', old['phases'][name]['seconds'], result['phases'][name]['seconds'] ))
+				checks.append(( name + ' requests', old['phases'][name]['requests'], result['phases'][name]['requests'] ))
+
+		for what, before, now in checks :
+			# very short phases are all noise; allow them a small absolute slack
+			slack = 0.05 if 'seconds' in what else 0
+			if now > before * (1.0 + tolerance) + slack :
+				regressions.append("%s: %s went from %.3f to %.3f" % (project, what, before, now))
+	return regressions
+
+## printTable
+#
+# Print the results in a readable table
+def printTable(results) :
+	print("%-18s %-9s %9s %9s %12s %9s" % ('project', 'phase', 'seconds', 'requests', 'bytes', 'rss_mb'))
+	for project, result in results.items() :
+		for name in PHASES :
+			if name in result['phases'] :
+				phase = result['phases'][name]
+				print("%-18s %-9s %9.3f %9d %12d %9.1f" % (project, name, phase['seconds'], phase['requests'], phase['bytes'], phase['rss_mb']))
+		print("%-18s %-9s %9.3f %9d %12s %9.1f   FO %d bytes" % (project, 'total', result['seconds'], result['requests'], '', result['rss_mb'], result['fo_bytes']))
+
+## main
+#
+# Start the mock server, run every project size in a child process, and report
+def main(args) :
+	sizes = [ int(size) for size in args.sizes.split(',') ]
+	server = mockserver.serve('127.0.0.1', args.port, sizes, args.latency)
+	port = server.server_address[1]
+	threading.Thread(target = server.serve_forever, daemon = True).start()
+	print("|- Mock Code Dx on port " + str(port) + " with " + str(args.latency) + "s latency")
+
+	workdir = args.workdir or tempfile.mkdtemp(prefix = 'stig-bench-')
+	os.makedirs(workdir, exist_ok = True)
+	results = {}
+	for size in sizes :
+		project = 'synthetic-' + str(size)
+		config = os.path.join(workdir, project + '.ini')
+		result = os.path.join(workdir, project + '.json')
+		log = os.path.join(workdir, project + '.log')
+		writeConfig(config, workdir, port, project, args.set)
+
+		print("|- Running " + project + " (log in " + log + ")")
+		command = [ sys.executable, os.path.abspath(__file__), '--child', '--port', str(port),
+					'--config', config, '--result', result ]
+		if args.cache :
+			command.append('--cache')
+		with open(log, 'w') as output :
+			status = subprocess.call(command, stdout = output, stderr = subprocess.STDOUT)
+		if status != 0 :
+			print("|- " + project + " failed with status " + str(status) + ", see " + log)
+			continue
+		with open(result) as f :
+			results[project] = json.load(f)
+
+	server.shutdown()
+	printTable(results)
+	if args.output :
+		with open(args.output, 'w') as f :
+			json.dump(results, f, indent = 1)
+		print("|- Results written to " + args.output)
+
+	if args.baseline :
+		with open(args.baseline) as f :
+			baseline = json.load(f)
+		regressions = compare(results, baseline, args.tolerance)
+		for regression in regressions :
+			print("|- REGRESSION " + regression)
+		if len(regressions) > 0 :
+			return 1
+		print("|- No regressions against " + args.baseline)
+
+	return 0 if len(results) == len(sizes) else 1
+
+if __name__ == "__main__" :
+	parser = argparse.ArgumentParser(description = 'Benchmark the report against a mock Code Dx server.')
+	parser.add_argument("--sizes", default = '100,1000,10000', help = "Comma separated finding counts, one project each")
+	parser.add_argument("--latency", type = float, default = 0.0, help = "Seconds of delay the mock adds to each request")
+	parser.add_argument("--port", type = int, default = 0, help = "Port for the mock server (default: any free port)")
+	parser.add_argument("--set", action = 'append', default = [], help = "Configuration override, as Section.key=value")
+	parser.add_argument("--cache", action = 'store_true', help = "Use the response cache (off by default)")
+	parser.add_argument("--workdir", help = "Directory for configurations, logs and output (default: a new temporary one)")
+	parser.add_argument("--output", "-o", help = "Write the results to this JSON file")
+	parser.add_argument("--baseline", help = "Results of an earlier run to check for regressions")
+	parser.add_argument("--tolerance", type = float, default = 0.2, help = "Allowed growth over the baseline (default 0.2)")
+	parser.add_argument("--child", action = 'store_true', help = argparse.SUPPRESS)
+	parser.add_argument("--config", help = argparse.SUPPRESS)
+	parser.add_argument("--result", help = argparse.SUPPRESS)
+	args = parser.parse_args()
+
+	if args.child :
+		runChild(args)
+	else :
+		sys.exit(main(args))
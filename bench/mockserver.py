@@ -0,0 +1,337 @@
+#!/usr/bin/python
+## Mock Code Dx Server
+#
+# A stand-in for a Code Dx server that answers the endpoints used by 'codedx.py' with
+# synthetic data.  It is meant for benchmarking the report without a live server, and
+# only needs the Python standard library.
+#
+# Every project is generated from its finding count, so the same project always returns
+# the same data.  Findings are never stored; each page of the findings table is computed
+# when it is requested, which keeps the server small even for 500k findings.
+#
+# A fixed latency may be added to every request to imitate a remote server.  Request
+# counts and bytes sent per endpoint are available from '/__stats' and are cleared with
+# '/__reset'.
+import argparse
+import json
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Layout of the synthetic STIG tree.  Each CAT holds this many leaf STIGs.
+CAT_NAMES  = [ 'CAT I', 'CAT II', 'CAT III' ]
+CAT_STIGS  = [ 15, 30, 15 ]
+STIG_COUNT = sum(CAT_STIGS)
+STIG_NODE  = 1000	# leaf STIG nodes are numbered 'standard-node:1000' onward
+ROOT_NODE  = 900	# the DISA STIG node, with the CAT nodes right after it
+
+TOOLS = [ 'Fortify', 'SpotBugs', 'Checkmarx', 'PMD', 'ESLint' ]
+FILE_LINES = 400
+
+## Synthetic Project
+#
+# Finding 'i' belongs to STIG 'i % STIG_COUNT'.  Every seventh finding also belongs to
+# the following STIG, so the report sees findings shared between STIGs.
+class Project :
+	def __init__(self, project_id, name, count) :
+		self.id = project_id
+		self.name = name
+		self.count = count
+		self.files = max(10, count // 20)
+		self.analysis = 1
+		self.members = {}
+		self.lock = threading.Lock()
+
+	## stigs
+	#
+	# Return the STIG indices a finding belongs to
+	def stigs(self, i) :
+		first = i % STIG_COUNT
+		if i % 7 == 0 :
+			return [ first, (first + 1) % STIG_COUNT ]
+		return [ first ]
+
+	## stigMembers
+	#
+	# Return the sorted finding indices of one STIG.  These are computed once per STIG.
+	def stigMembers(self, stig) :
+		with self.lock :
+			if stig not in self.members :
+				own = range(stig, self.count, STIG_COUNT)
+				prev = (stig - 1) % STIG_COUNT
+				shared = [ i for i in range(prev, self.count, STIG_COUNT) if i % 7 == 0 ]
+				self.members[stig] = sorted(set(own) | set(shared))
+			return self.members[stig]
+
+	## stigCount
+	#
+	# Number of findings in a STIG
+	def stigCount(self, stig) :
+		return len(self.stigMembers(stig))
+
+	## finding
+	#
+	# Produce the findings table record for finding index 'i'
+	def finding(self, i, expand) :
+		fileid = i % self.files
+		record = { 'id'         : i + 1,
+				   'descriptor' : { 'name' : 'Synthetic Rule ' + str(i % 97) },
+				   'location'   : { 'path'  : { 'id' : fileid, 'path' : 'src/main/java/Synthetic' + str(fileid) + '.java' },
+									'lines' : { 'start' : 1 + (i * 13) % FILE_LINES } },
+				   'results'    : [] }
+		if 'descriptor.standards' in expand :
+			record['descriptor']['standards'] = [ { 'id' : 'standard-node:' + str(STIG_NODE + s) } for s in self.stigs(i) ]
+		for t in range(1 + i % 2) :
+			result = { 'tool' : TOOLS[(i + t) % len(TOOLS)] }
+			if 'results.metadata' in expand :
+				result['metadata'] = { 'Vendor ID' : 'SYN-' + str(i % 211) }
+			record['results'].append(result)
+		return record
+
+	## fileText
+	#
+	# Produce the contents of a source file
+	def fileText(self, fileid) :
+		return ''.join('    int line' + str(n) + ' = ' + str(fileid) + ' * ' + str(n) + ';\n' for n in range(1, FILE_LINES + 1))
+
+	## groupedCounts
+	#
+	# Produce the grouped-counts tree for the DISA STIG standard
+	def groupedCounts(self) :
+		cats = []
+		stig = 0
+		for c, name in enumerate(CAT_NAMES) :
+			leaves = []
+			for n in range(CAT_STIGS[c]) :
+				leaves.append({ 'id'    : 'standard-node:' + str(STIG_NODE + stig),
+								'name'  : 'APSC-DV-%06d Synthetic requirement %d' % (10 * (stig + 1), stig + 1),
+								'count' : self.stigCount(stig) })
+				stig += 1
+			cats.append({ 'id' : 'standard-node:' + str(ROOT_NODE + c + 1), 'name' : name,
+						  'count' : sum(leaf['count'] for leaf in leaves), 'children' : leaves })
+		return [ { 'id' : 'standard-node:' + str(ROOT_NODE), 'name' : 'DISA STIG 4.10', 'count' : self.count, 'children' : cats } ]
+
+	## table
+	#
+	# Return one page of the findings table for the filter
+	def table(self, body, expand) :
+		nodes = body.get('filter', {}).get('standard', 'standard-node:' + str(ROOT_NODE))
+		if not isinstance(nodes, list) :
+			nodes = [ nodes ]
+		nodes = [ int(str(node).split(':')[-1]) for node in nodes ]
+		page = body.get('pagination', { 'page' : 1, 'perPage' : 2500 })
+		first = (int(page['page']) - 1) * int(page['perPage'])
+		last = first + int(page['perPage'])
+		return [ self.finding(i, expand) for i in self.nodeMembers(nodes)[first:last] ]
+
+	## nodeMembers
+	#
+	# Sorted finding indices under a set of standard nodes.  The root or a CAT node stands
+	# for every STIG below it.
+	def nodeMembers(self, nodes) :
+		stigs = set()
+		for node in nodes :
+			if node >= STIG_NODE :
+				stigs.add(node - STIG_NODE)
+			elif node == ROOT_NODE :
+				stigs.update(range(STIG_COUNT))
+			else :
+				first = sum(CAT_STIGS[:node - ROOT_NODE - 1])
+				stigs.update(range(first, first + CAT_STIGS[node - ROOT_NODE - 1]))
+		if len(stigs) == STIG_COUNT :
+			return range(self.count)
+		if len(stigs) == 1 :
+			return self.stigMembers(stigs.pop())
+		return sorted(set().union(*[ self.stigMembers(stig) for stig in stigs ]))
+
+## Mock Server State
+#
+# Shared between the request handler threads
+class State :
+	def __init__(self, sizes, latency) :
+		self.latency = latency
+		self.projects = {}
+		for n, size in enumerate(sizes) :
+			project = Project(n + 1, 'synthetic-' + str(size), size)
+			self.projects[project.id] = project
+		self.lock = threading.Lock()
+		self.jobs = 0
+		self.preps = {}
+		self.reset()
+
+	def reset(self) :
+		with self.lock :
+			self.stats = { 'requests' : 0, 'bytes' : 0, 'endpoints' : {} }
+
+	def record(self, endpoint, size) :
+		with self.lock :
+			self.stats['requests'] += 1
+			self.stats['bytes'] += size
+			entry = self.stats['endpoints'].setdefault(endpoint, { 'requests' : 0, 'bytes' : 0 })
+			entry['requests'] += 1
+			entry['bytes'] += size
+
+	def newJob(self) :
+		with self.lock :
+			self.jobs += 1
+			return 'job-' + str(self.jobs)
+
+## Request Handler
+#
+# Routes are matched in order against the request path.  Each route returns a status
+# and a JSON-able body, or a string for raw file contents.
+class Handler(BaseHTTPRequestHandler) :
+	protocol_version = 'HTTP/1.1'
+
+	# buffer the headers and body into one write.  Sent separately, the client's delayed
+	# acknowledgement stalls every keep-alive response by tens of milliseconds
+	wbufsize = 64 * 1024
+
+	ROUTES = [ ( 'GET',  r'/codedx/api/projects$',                                  'projects' ),
+			   ( 'GET',  r'/codedx/api/standards/filter-views$',                    'standards' ),
+			   ( 'POST', r'/codedx/api/projects/(\d+)/findings/grouped-counts$',    'groupedCounts' ),
+			   ( 'POST', r'/codedx/api/projects/(\d+)/findings/table$',             'table' ),
+			   ( 'GET',  r'/codedx/api/projects/(\d+)/files/(\d+)$',                'file' ),
+			   ( 'GET',  r'/codedx/api/projects/(\d+)/analyses$',                   'analyses' ),
+			   ( 'POST', r'/codedx/x/dashboard/(\d+)$',                             'dashboard' ),
+			   ( 'POST', r'/codedx/api/analysis-prep$',                             'analysisPrep' ),
+			   ( 'POST', r'/codedx/api/analysis-prep/([^/]+)/upload$',              'upload' ),
+			   ( 'POST', r'/codedx/api/analysis-prep/([^/]+)/analyze$',             'analyze' ),
+			   ( 'GET',  r'/codedx/api/jobs/([^/]+)$',                              'job' ),
+			   ( 'GET',  r'/__stats$',                                              'stats' ),
+			   ( 'GET',  r'/__reset$',                                              'reset' ) ]
+
+	def log_message(self, format, *args) :
+		pass
+
+	def do_GET(self) :
+		self.dispatch('GET')
+
+	def do_POST(self) :
+		self.dispatch('POST')
+
+	def dispatch(self, method) :
+		state = self.server.state
+		url = urllib.parse.urlsplit(self.path)
+		query = urllib.parse.parse_qs(url.query)
+		body = self.readBody()
+		for route_method, pattern, name in self.ROUTES :
+			match = re.match(pattern, url.path)
+			if match and route_method == method :
+				if not name in ( 'stats', 'reset' ) and state.latency > 0 :
+					time.sleep(state.latency)
+				try :
+					status, payload = getattr(self, 'route_' + name)(state, body, query, *match.groups())
+				except KeyError :
+					status, payload = 404, { 'error' : 'not found' }
+				self.send(status, payload, name)
+				return
+		self.send(404, { 'error' : 'no route' }, 'unknown')
+
+	def readBody(self) :
+		if self.headers.get('Transfer-Encoding', '').lower() == 'chunked' :
+			data = b''
+			while True :
+				size = int(self.rfile.readline().strip() or b'0', 16)
+				if size == 0 :
+					self.rfile.readline()
+					break
+				data += self.rfile.read(size)
+				self.rfile.readline()
+			return data
+		length = int(self.headers.get('Content-Length', 0))
+		return self.rfile.read(length) if length else b''
+
+	def send(self, status, payload, endpoint) :
+		if isinstance(payload, str) :
+			data = payload.encode('utf-8')
+			ctype = 'text/plain'
+		else :
+			data = json.dumps(payload).encode('utf-8')
+			ctype = 'application/json'
+		if not endpoint in ( 'stats', 'reset' ) :
+			self.server.state.record(endpoint, len(data))
+		self.send_response(status)
+		self.send_header('Content-Type', ctype)
+		self.send_header('Content-Length', str(len(data)))
+		self.end_headers()
+		self.wfile.write(data)
+
+	def json(self, body) :
+		return json.loads(body.decode('utf-8')) if body else {}
+
+	def route_projects(self, state, body, query) :
+		return 200, { 'projects' : [ { 'id' : p.id, 'name' : p.name } for p in state.projects.values() ] }
+
+	def route_standards(self, state, body, query) :
+		return 200, [ { 'name' : 'DISA STIG 4.10', 'countBy' : 'standard:12' },
+					  { 'name' : 'DISA STIG 4.3', 'countBy' : 'standard:7' },
+					  { 'name' : 'OWASP Top 10 2017', 'countBy' : 'standard:3' } ]
+
+	def route_groupedCounts(self, state, body, query, project_id) :
+		return 200, state.projects[int(project_id)].groupedCounts()
+
+	def route_table(self, state, body, query, project_id) :
+		expand = ','.join(query.get('expand', []))
+		return 200, state.projects[int(project_id)].table(self.json(body), expand)
+
+	def route_file(self, state, body, query, project_id, file_id) :
+		return 200, state.projects[int(project_id)].fileText(int(file_id))
+
+	def route_analyses(self, state, body, query, project_id) :
+		return 200, [ { 'id' : state.projects[int(project_id)].analysis, 'state' : 'complete' } ]
+
+	def route_dashboard(self, state, body, query, project_id) :
+		project = state.projects[int(project_id)]
+		return 200, { 'codeMetrics' : [ { 'data' : { 'Java'       : { 'numTotalLines' : project.files * FILE_LINES, 'numSourceFiles' : project.files },
+													  'JavaScript' : { 'numTotalLines' : 1200, 'numSourceFiles' : 4 } } } ] }
+
+	def route_analysisPrep(self, state, body, query) :
+		prep_id = 'prep-' + state.newJob()
+		state.preps[prep_id] = int(self.json(body)['projectId'])
+		return 200, { 'prepId' : prep_id }
+
+	def route_upload(self, state, body, query, prep_id) :
+		if not prep_id in state.preps :
+			raise KeyError(prep_id)
+		return 202, { 'jobId' : state.newJob() }
+
+	# running an analysis moves the project on to a new analysis ID, as a real server
+	# would, which invalidates cached responses for it
+	def route_analyze(self, state, body, query, prep_id) :
+		state.projects[state.preps[prep_id]].analysis += 1
+		return 202, { 'jobId' : state.newJob() }
+
+	def route_job(self, state, body, query, job_id) :
+		return 200, { 'jobId' : job_id, 'status' : 'completed' }
+
+	def route_stats(self, state, body, query) :
+		with state.lock :
+			return 200, json.loads(json.dumps(state.stats))
+
+	def route_reset(self, state, body, query) :
+		state.reset()
+		return 200, { 'reset' : True }
+
+## serve
+#
+# Create the server.  The caller runs 'serve_forever' on it, in a thread if needed.
+def serve(host, port, sizes, latency) :
+	server = ThreadingHTTPServer((host, port), Handler)
+	server.daemon_threads = True
+	server.state = State(sizes, latency)
+	return server
+
+if __name__ == "__main__" :
+	parser = argparse.ArgumentParser(description = 'Serve synthetic Code Dx projects for benchmarking.')
+	parser.add_argument("--host", default = '127.0.0.1', help = "Address to listen on")
+	parser.add_argument("--port", type = int, default = 8100, help = "Port to listen on")
+	parser.add_argument("--sizes", default = '100,1000,10000,100000,500000', help = "Comma separated finding counts, one project each")
+	parser.add_argument("--latency", type = float, default = 0.0, help = "Seconds of delay added to each request")
+	args = parser.parse_args()
+
+	server = serve(args.host, args.port, [ int(size) for size in args.sizes.split(',') ], args.latency)
+	print("|- Mock Code Dx serving " + ', '.join(p.name for p in server.state.projects.values()) + " on port " + str(args.port))
+	server.serve_forever()
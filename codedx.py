@@ -5,10 +5,130 @@
 # the "requests" package to perform all of the network operations.
 
 import requests
+import requests.adapters
+from urllib3.util.retry import Retry
 import configparser
 import json
 import time
+import random
 import sys
+import os
+import uuid
+import codecs
+import concurrent.futures
+import threading
+from ResponseCache import ResponseCache
+from SourceStore import SourceStore
+import Profiler
+
+# job states that will not change again
+JOB_TERMINAL_STATES = ( 'completed', 'failed', 'cancelled' )
+
+# responses that mean the server is too busy, and the request was not acted on
+BUSY_STATUSES = ( 429, 503 )
+
+# size of the pieces source files are read in while they are spooled
+SOURCE_CHUNK = 64 * 1024
+
+## sourceEncoding
+#
+# The text encoding of a downloaded source file, from its Content-Type: the charset the
+# server gives, otherwise UTF-8.  The sync and async clients both spool sources with it,
+# so a file decodes the same whichever fetched it.  (requests would assume ISO-8859-1 for
+# text/* without a charset.)
+def sourceEncoding(content_type) :
+	for param in (content_type or '').split(';')[1 :] :
+		name, sep, value = param.partition('=')
+		value = value.strip().strip('"\'')
+		if name.strip().lower() == 'charset' and value != '' :
+			try :
+				return codecs.lookup(value).name
+			except LookupError :
+				break
+	return 'utf-8'
+
+## TimeoutHTTPAdapter
+#
+# A requests transport adapter that applies default connect and read timeouts to every
+# request sent through it, so a busy server cannot hang the report indefinitely.
+class TimeoutHTTPAdapter(requests.adapters.HTTPAdapter) :
+	def __init__(self, timeout, **kwargs) :
+		self.timeout = timeout
+		super().__init__(**kwargs)
+	
+	def send(self, request, **kwargs) :
+		if kwargs.get('timeout') is None :
+			kwargs['timeout'] = self.timeout
+		return super().send(request, **kwargs)
+
+## QueryRetry
+#
+# Retry policy for the read-only endpoints.  The Code Dx queries are POSTs, which are
+# not normally retried; a busy status is retried for any method.
+class QueryRetry(Retry) :
+	def is_retry(self, method, status_code, has_retry_after = False) :
+		if status_code in BUSY_STATUSES :
+			return True
+		return super().is_retry(method, status_code, has_retry_after)
+
+## serverUrl
+#
+# Build the server's base URL from the '[CodeDx]' section of the configuration
+def serverUrl(ini) :
+
+	# begin by building up the URL we will be using
+	transport = ini.get('CodeDx', 'transport').lower()
+	url = transport + '://' + ini.get('CodeDx', 'server')
+	
+	# omit the port if the server's transport matches the requested port.  Also,
+	# the port number is optional, and may be omitted
+	try :
+		port = ini.get('CodeDx', 'port')
+		if ( transport == 'http' ) and ( int(port) != 80 ) :
+			url += ':' + str(port)
+		else :
+			if ( transport == 'https' ) and ( int(port) != 443 ) :
+				url += ':' + str(port)
+	
+	# port number was not specified.  We will rely on the transport to select the
+	# appropriate port.  This is not an error
+	except :
+		pass
+	
+	return url
+
+## apiHeaders
+#
+# Return the headers sent with every request, including the API key
+def apiHeaders(ini) :
+
+	# add the default headers that are required
+	headers = { 'accept' : 'application/json' }
+	try :
+		apikey = ini.get('CodeDx', 'api-key')
+	except :
+		print("|-- [Code Dx Constructor] ERROR: no API key specified in configuration file")
+		raise ValueError("No API Key specified")
+	
+	headers['API-Key'] = apikey
+	return headers
+
+## multipartBody
+#
+# Produce a multipart/form-data body holding one file as field 'file', a piece at a
+# time.  Handing the generator to requests sends it with chunked transfer encoding.
+def multipartBody(fileobj, filename, boundary, chunk_size) :
+
+	filename = filename.replace('"', '%22')
+	yield ( '--' + boundary + '\r\n' +
+			'Content-Disposition: form-data; name="file"; filename="' + filename + '"\r\n' +
+			'Content-Type: application/octet-stream\r\n\r\n' ).encode('utf-8')
+	while True :
+		chunk = fileobj.read(chunk_size)
+		if not chunk :
+			break
+		yield chunk
+	yield ( '\r\n--' + boundary + '--\r\n' ).encode('utf-8')
 
 class CodeDx :
 	## Constructor
@@ -22,36 +142,22 @@ class CodeDx :
 	#
 	# Requests is used as a "session" to allow easy access to repeatedly used
 	# headers.  Please note that all headers, and parameters are persistent and will
-	# be repeated with each request.  Therefore, all uses should revert those two
-	# fields back to the original values if possible.
+	# be repeated with each request.  The session is shared by the collection worker
+	# threads, so call specific parameters must be passed with the request itself
+	# and never written into the session.
 	#
 	# An upgrade to this class will be to allow any access to certificates from
 	# "Let's Encrypt" servers to be used without ignoring the "self signed" certificate
 	# warnings.  It would also show the user how to incorporate their own certs to
 	# allow proper authentication when used.
-	def __init__(self, ini) :
-		
-		# begin by building up the URL we will be using
-		transport = ini.get('CodeDx', 'transport').lower()
-		url = transport + '://' + ini.get('CodeDx', 'server')
-		
-		# omit the port if the server's transport matches the requested port.  Also,
-		# the port number is optional, and may be omitted
-		try :
-			port = ini.get('CodeDx', 'port')
-			if ( transport == 'http' ) and ( int(port) != 80 ) :
-				url += ':' + str(port)
-			else :
-				if ( transport == 'https' ) and ( int(port) != 443 ) :
-					url += ':' + str(port)
-		
-		# port number was not specified.  We will rely on the transport to select the
-		# appropriate port.  This is not an error
-		except :
-			pass
+	#
+	# The cache mode is handed to the response cache.  See ResponseCache for the modes.
+	def __init__(self, ini, cache_mode = 'use') :
 		
-		# append the Code Dx default location for API work and assign the entire
-		# string to a reusable class scoped variable.
+		# begin by building up the URL we will be using.  Append the Code Dx default
+		# location for API work and assign the entire string to a reusable class scoped
+		# variable.
+		url = serverUrl(ini)
 		self.url = url + '/codedx/api'
 		self.urlx = url + '/codedx/x'	# for some experimental API calls
 		print("|-- [Code Dx Constructor] using URL: \"%s\"" % self.url)
@@ -59,28 +165,89 @@ class CodeDx :
 		# create a requests 'session' to store the data in general.  The URL is outside
 		# of that scope
 		self.session = requests.session()
+		self.mountAdapters(ini)
 		
 		# add the default headers that are required
-		headers = { 'accept' : 'application/json' }
-		try :
-			apikey = ini.get('CodeDx', 'api-key')
-		except :
-			print("|-- [Code Dx Constructor] ERROR: no API key specified in configuration file")
-			raise ValueError("No API Key specified")
-		
-		headers['API-Key'] = apikey
+		headers = apiHeaders(ini)
 		self.session.headers.update(headers)
 		
+		# every request is counted when the run is profiled (--profile)
+		self.session.hooks['response'].append(Profiler.responseHook)
+		
 		# add a proxy if necessary.  It will be used for the entire session
 		# proxies = { 'http' : 'http://127.0.0.1:8090', 'https' : 'http://127.0.0.1:8090' }
 		# self.session.proxies.update(proxies)
 		
+		# responses are kept on disk between runs.  Project queries are tied to the
+		# project's latest analysis, which is looked up once per run
+		self.cache = ResponseCache(ini.get('CodeDx', 'cache_dir', fallback = '.cdxcache'),
+								   ini.getint('CodeDx', 'cache_size_mb', fallback = 256) * 1024 * 1024,
+								   ini.getint('CodeDx', 'cache_max_age', fallback = 3600),
+								   cache_mode)
+		self.latestAnalysis = {}
+		self.latestAnalysisLock = threading.Lock()
+		self.standards = None
+		self.standardsLock = threading.Lock()
+		
 		# create a project dictionary to contain the Code Dx project ID.
 		self.getProjectIds()
 		
-		# set up a storage location for getFileLines - trying to make this a little faster
-		self.getFileStorage   = ''
-		self.getFileStorageId = -1
+		# job polling.  Waits start at the initial delay and back off to the maximum,
+		# until the overall timeout (all in seconds)
+		self.jobTimeout     = ini.getfloat('CodeDx', 'job_timeout', fallback = 3600)
+		self.jobPollInitial = ini.getfloat('CodeDx', 'job_poll_initial', fallback = 0.5)
+		self.jobPollMax     = ini.getfloat('CodeDx', 'job_poll_max', fallback = 30)
+		
+		# concurrent uploads for sendFilesandWait, and the size of each piece of a file
+		# sent while streaming it
+		self.uploadWorkers = ini.getint('CodeDx', 'upload_workers', fallback = 4)
+		self.uploadChunk   = ini.getint('CodeDx', 'upload_chunk_kb', fallback = 64) * 1024
+		
+		# number of findings requested per page by findingTableIter
+		self.pageSize = ini.getint('CodeDx', 'page_size', fallback = 2500)
+		
+		# set up a storage location for getFileLines - trying to make this a little faster.
+		# Source files are spooled to disk beside the response cache and kept between
+		# runs.  The counts record how much was actually transferred
+		self.sources = SourceStore(ini.get('CodeDx', 'source_dir', fallback = os.path.join(self.cache.directory, 'sources')),
+								   ini.getint('CodeDx', 'source_cache_mb', fallback = 1024) * 1024 * 1024,
+								   cache_mode)
+		self.fileStats     = { 'files' : 0, 'bytes' : 0 }
+		self.fileStatsLock = threading.Lock()
+	
+	## mountAdapters
+	#
+	# Set up the connection pool, timeouts and retries for the session from the
+	# '[CodeDx]' section.  The pool is kept at least as large as the number of
+	# collection workers, twice over as the pipelined collection runs findings queries
+	# and file downloads side by side, so parallel queries reuse warm connections rather
+	# than opening (and TLS negotiating) new ones.
+	#
+	# Requests that fail to connect, and idempotent requests, are retried with backoff.
+	# So are 429 and 503 responses to the read-only queries; the server turned those away
+	# without acting on them.  The analysis-prep endpoints create and upload things, so
+	# their POSTs are never repeated.
+	def mountAdapters(self, ini) :
+	
+		workers = ini.getint('Report', 'collection_workers', fallback = 1)
+		pool_size = ini.getint('CodeDx', 'pool_size', fallback = max(10, 2 * workers))
+		timeout = ( ini.getfloat('CodeDx', 'connect_timeout', fallback = 10),
+					ini.getfloat('CodeDx', 'read_timeout', fallback = 300) )
+		retries = ini.getint('CodeDx', 'retries', fallback = 3)
+		backoff = ini.getfloat('CodeDx', 'retry_backoff', fallback = 0.5)
+		
+		query_retry = QueryRetry(total = retries, backoff_factor = backoff,
+								 status_forcelist = BUSY_STATUSES, raise_on_status = False)
+		prep_retry = Retry(total = retries, backoff_factor = backoff,
+						   status_forcelist = BUSY_STATUSES, raise_on_status = False)
+		
+		# the longest matching prefix wins, so the analysis-prep adapter takes over
+		# from the general one for those endpoints
+		for prefix in [ 'http://', 'https://' ] :
+			self.session.mount(prefix, TimeoutHTTPAdapter(timeout, pool_connections = pool_size,
+														  pool_maxsize = pool_size, max_retries = query_retry))
+		self.session.mount(self.url + '/analysis-prep', TimeoutHTTPAdapter(timeout, pool_connections = pool_size,
+																		  pool_maxsize = pool_size, max_retries = prep_retry))
 	
 	## getProjectIds
 	#
@@ -90,14 +257,20 @@ class CodeDx :
 	def getProjectIds(self) :
 	
 		# format the URL for the location we wish to accress
-		url = self.url + '/projects'
-		resp = self.session.get(url, verify = False)
-		if resp.status_code != 200 :
-			print("|-- [CDX getProjectIds] get projects responded [%d]" % resp.status_code)
-			return {}
+		key = self.cache.key('projects')
+		list = self.cache.get(key, max_age = True)
+		if list is None :
+			url = self.url + '/projects'
+			resp = self.session.get(url, verify = False)
+			if resp.status_code != 200 :
+				print("|-- [CDX getProjectIds] get projects responded [%d]" % resp.status_code)
+				return {}
+			
+			# we got a good response.  De-Jsonize the response and keep it
+			list = resp.json()
+			self.cache.put(key, list)
 		
-		# we got a good response.  De-Jsonize the response and return the dictionary
-		list = resp.json()
+		# create the dictionary from the list
 		self.projectIds = {}
 		for project in list['projects'] :
 			self.projectIds[project['name']] = project['id']
@@ -137,32 +310,133 @@ class CodeDx :
 		jobStatus = resp.json()['status']
 		return jobStatus
 	
-	## sendFileandWait
+	## waitForJobs
 	#
-	# Send the requested filename and wait until the job returns 'completed'
-	def sendFileandWait(self, prepId, filename) :
+	# Wait on one or more jobs from a single polling loop.  Each pass asks for the status
+	# of every job still running; jobs that reached 'completed', 'failed' or 'cancelled'
+	# are done.  Between passes we sleep, starting at 'initial' seconds and doubling up
+	# to 'maximum', with some random jitter so many waiting clients do not poll in step.
+	#
+	# Returns a dictionary of job ID to final status.  Any job still running when the
+	# timeout passes is given the status 'timeout'.  Anything not given defaults to the
+	# job settings in the configuration.
+	def waitForJobs(self, jobIds, timeout = None, initial = None, maximum = None) :
+	
+		if timeout is None :
+			timeout = self.jobTimeout
+		if initial is None :
+			initial = self.jobPollInitial
+		if maximum is None :
+			maximum = self.jobPollMax
+		
+		deadline = time.monotonic() + timeout
+		delay = initial
+		pending = list(jobIds)
+		results = {}
+		while True :
+			for jobId in list(pending) :
+				status = self.queryJobStatus(jobId)
+				if status in JOB_TERMINAL_STATES :
+					results[jobId] = status
+					pending.remove(jobId)
+			
+			if len(pending) == 0 :
+				break
+			
+			# out of time?  Whatever is left has timed out
+			remaining = deadline - time.monotonic()
+			if remaining <= 0 :
+				for jobId in pending :
+					print("|-- [CDX waitForJobs] job [%s] did not finish in %d seconds" % (jobId, timeout))
+					results[jobId] = 'timeout'
+				break
+			
+			# sleep between half and all of the current delay, then back off
+			time.sleep(min(remaining, random.uniform(delay / 2, delay)))
+			delay = min(delay * 2, maximum)
+		
+		return results
+	
+	## waitForJob
+	#
+	# Wait on a single job.  Returns its final status, see waitForJobs
+	def waitForJob(self, jobId, timeout = None, initial = None, maximum = None) :
+		return self.waitForJobs([ jobId ], timeout, initial, maximum)[jobId]
+	
+	## uploadFile
+	#
+	# Start the upload of one file into the analysis prep, and return the job ID for it
+	# (or None if the server refused).  The file is streamed as a chunked multipart body
+	# so it is never held in memory as a whole.
+	def uploadFile(self, prepId, filename) :
 	
 		# format the url
 		url = self.url + '/analysis-prep/' + prepId + '/upload'
-		files = { 'file' : open(filename, 'rb') }
-		self.session.params.update({ 'X-Client-Request-Id' : 'xyzzy22' })
-		resp = self.session.post(url, files = files)
-		self.session.params.update({ 'X-Client-Request-Id' : None })
+		params = { 'X-Client-Request-Id' : 'xyzzy22' }
+		boundary = uuid.uuid4().hex
+		headers = { 'Content-Type' : 'multipart/form-data; boundary=' + boundary }
+		with open(filename, 'rb') as f :
+			body = multipartBody(f, os.path.basename(filename), boundary, self.uploadChunk)
+			resp = self.session.post(url, params = params, headers = headers, data = body)
 		if resp.status_code != 202 :
-			print("|-- [CDX sendFileandWait] responded [%d]" % resp.status_code)
+			print("|-- [CDX uploadFile] \"%s\" responded [%d]" % (filename, resp.status_code))
+			return None
+		
+		return resp.json()['jobId']
+	
+	## sendFileandWait
+	#
+	# Send the requested filename and wait until the job returns 'completed'
+	def sendFileandWait(self, prepId, filename) :
+	
+		# send the file, then check the job status until it is done
+		jobId = self.uploadFile(prepId, filename)
+		if jobId is None :
 			return False
 		
-		# got a good send.  Check the job status until it is done
-		jobId = resp.json()['jobId']
-		while True :
-			status = self.queryJobStatus(jobId)
-			if status == 'completed' :
-				break
-			time.sleep(1)
+		status = self.waitForJob(jobId)
+		if status != 'completed' :
+			print("|-- [CDX sendFileandWait] upload of \"%s\" ended with status [%s]" % (filename, status))
+			return False
 		
 		# we're good!  File has been sent
 		print("|-- [CDX sendFileandWait] sent \"%s\"" % filename)
 		return True
+	
+	## sendFilesandWait
+	#
+	# Send several files into the analysis prep at once, then wait on all of their jobs
+	# together.  Uploads run on up to 'workers' threads (by default 'upload_workers'
+	# from the configuration).  Returns True only if every file was accepted and its
+	# job completed, so the analysis may be run.
+	def sendFilesandWait(self, prepId, filenames, workers = None) :
+	
+		if workers is None :
+			workers = self.uploadWorkers
+		if len(filenames) == 0 :
+			return True
+		
+		# start all of the uploads
+		with concurrent.futures.ThreadPoolExecutor(max_workers = min(workers, len(filenames))) as pool :
+			jobIds = list(pool.map(lambda filename : self.uploadFile(prepId, filename), filenames))
+		
+		ok = True
+		jobs = {}
+		for filename, jobId in zip(filenames, jobIds) :
+			if jobId is None :
+				ok = False
+			else :
+				jobs[jobId] = filename
+		
+		# and wait for the server to finish with them
+		for jobId, status in self.waitForJobs(list(jobs.keys())).items() :
+			if status != 'completed' :
+				print("|-- [CDX sendFilesandWait] upload of \"%s\" ended with status [%s]" % (jobs[jobId], status))
+				ok = False
+			else :
+				print("|-- [CDX sendFilesandWait] sent \"%s\"" % jobs[jobId])
+		
+		return ok
 		
 	## runAnalysisandWait
 	#
@@ -176,41 +450,103 @@ class CodeDx :
 			print("|-- [CDX runAnalysisandWait] responded [%d]" % resp.status_code)
 			return False
 			
-		# grab the jobId for this analysis and wait until it is done.  We use 3 second
-		# waits here as these usually take longer
+		# grab the jobId for this analysis and wait until it is done.  Analyses usually
+		# take longer, so the polling starts out slower
 		print("|-- [CDX runAnalysisandWait] analysis started")
 		jobId = resp.json()['jobId']
-		while True :
-			status = self.queryJobStatus(jobId)
-			if status == 'completed' :
-				break
-			time.sleep(3)
+		status = self.waitForJob(jobId, initial = max(self.jobPollInitial, 3))
+		if status != 'completed' :
+			print("|-- [CDX runAnalysisandWait] analysis ended with status [%s]" % status)
+			return False
 		
 		# we're good!  Analysis is done
 		print("|-- [CDX runAnalysisandWait] analysis completed.")
 		return True
 		
+	## getLatestAnalysisId
+	#
+	# Return the ID of the most recent analysis of the project, or None if it cannot be
+	# found.  The answer is kept for the rest of the run; it is what ties the cached
+	# project responses to the data they came from.
+	def getLatestAnalysisId(self, project_id) :
+	
+		with self.latestAnalysisLock :
+			if project_id in self.latestAnalysis :
+				return self.latestAnalysis[project_id]
+			
+			# format the url for this endpoint
+			url = self.url + '/projects/' + str(project_id) + '/analyses'
+			analysis_id = None
+			resp = self.session.get(url)
+			if resp.status_code == 200 :
+				ids = [ analysis['id'] for analysis in resp.json() ]
+				if len(ids) > 0 :
+					analysis_id = max(ids)
+			else :
+				print("|-- [CDX getLatestAnalysisId] responded [%d], project responses will not be cached" % resp.status_code)
+			
+			self.latestAnalysis[project_id] = analysis_id
+			return analysis_id
+	
+	## projectCacheKey
+	#
+	# Form the cache key for a project query.  No key is returned (and nothing is cached)
+	# if the project's latest analysis is unknown.
+	def projectCacheKey(self, endpoint, project_id, body) :
+	
+		if self.cache.mode == 'off' :
+			return None
+		
+		analysis_id = self.getLatestAnalysisId(project_id)
+		if analysis_id is None :
+			return None
+		return self.cache.key(endpoint, project_id, body, analysis_id)
+		
 	## GetStandards
 	#
 	# Collect the standards available on this server
 	def getStandards(self) :
 	
-		# format the url for this endpoint
-		url = self.url + '/standards/filter-views'
-		resp = self.session.get(url)
-		if resp.status_code != 200 :
-			print("|-- [CDX getStandards] responded [%d]" % resp.status_code)
-			return []
-		
-		# grab the standards list and return it as an array of JSON data
-		print("|-- [CDX getStandards] succeeded")
-		return resp.json()
+		# the standards are server wide, so they are only collected once per run, however
+		# many projects are reported
+		with self.standardsLock :
+			if self.standards is not None :
+				return self.standards
+			
+			# check the cache before asking the server
+			key = self.cache.key('standards/filter-views')
+			data = self.cache.get(key, max_age = True)
+			if data is not None :
+				self.standards = data
+				return data
+			
+			# format the url for this endpoint
+			url = self.url + '/standards/filter-views'
+			resp = self.session.get(url)
+			if resp.status_code != 200 :
+				print("|-- [CDX getStandards] responded [%d]" % resp.status_code)
+				return []
+			
+			# grab the standards list and return it as an array of JSON data
+			print("|-- [CDX getStandards] succeeded")
+			data = resp.json()
+			self.cache.put(key, data)
+			self.standards = data
+			return data
 	
 	## FindingsGroupedCount
 	#
-	# Collect findings by groups.  Currently used to collect the DISA STIG data
+	# Collect findings by groups.  Currently used to collect the DISA STIG data.  'fresh'
+	# always asks the server (the answer is still cached), for callers comparing the
+	# counts against an earlier run
 	#
-	def findingsGroupedCount(self, project_id, filter) :
+	def findingsGroupedCount(self, project_id, filter, fresh = False) :
+		
+		# check the cache before asking the server
+		key = self.projectCacheKey('findings/grouped-counts', project_id, filter)
+		data = None if fresh else self.cache.get(key)
+		if data is not None :
+			return data
 		
 		# format the url for this endpoint
 		url = self.url + '/projects/' + str(project_id) + '/findings/grouped-counts'
@@ -221,7 +557,9 @@ class CodeDx :
 			
 		# grab the list of findings counts and return the json
 		print("|-- [CDX findingsGroupedCount] succeeded")
-		return resp.json()
+		data = resp.json()
+		self.cache.put(key, data)
+		return data
 	
 	## getCodeMetrics
 	#
@@ -229,48 +567,105 @@ class CodeDx :
 	# one day (the most recent).
 	def getCodeMetrics(self, project_id) :
 	
+		# check the cache before asking the server
+		body = { "codeMetrics" : { "latest" : '1' }}
+		key = self.projectCacheKey('dashboard', project_id, body)
+		data = self.cache.get(key)
+		if data is not None :
+			return data
+		
 		# format the url for this endpoint
 		url = self.urlx + '/dashboard/' + str(project_id)
-		self.session.params.update({ 'includeChildProjects' : True })
-		resp = self.session.post(url, data = json.dumps({ "codeMetrics" : { "latest" : '1' }}))
-		
-		# remove parameters that are for a specific call
-		self.session.params.update({ 'includeChildProjects' : None })
+		params = { 'includeChildProjects' : True }
+		resp = self.session.post(url, params = params, data = json.dumps(body))
 		if resp.status_code != 200 :
 			print("|-- [CDX getCodeMetrics] responded [%d]" % resp.status_code)
 			return []
 		
 		# success.  Return the metrics
 		print("|-- [CDX getCodeMetrics] succeeded")
-		return resp.json()['codeMetrics']
+		data = resp.json()['codeMetrics']
+		self.cache.put(key, data)
+		return data
 		
 	## findingTableData
 	#
 	# Collect the findings for the given filter and parameters
 	def findingTableData(self, project_id, filter, params) :
 		
-		# format the url for this endpoint
+		# check the cache before asking the server.  The parameters change the content
+		# of the response, so they are part of the key
+		key = self.projectCacheKey('findings/table', project_id, [ filter, params ])
+		data = self.cache.get(key)
+		if data is not None :
+			return data
+		
+		# format the url for this endpoint.  The parameters are passed with this request
+		# only, rather than through the session, so that several threads may query the
+		# findings table at the same time.
 		url = self.url + '/projects/' + str(project_id) + '/findings/table'
-		self.session.params.update(params)
-		resp = self.session.post(url, data = json.dumps(filter))
+		resp = self.session.post(url, params = params, data = json.dumps(filter))
 		if resp.status_code != 200 :
 			print("|-- [CDX findingTableData] responded [%d]" % resp.status_code)
 			return []
 		
-		# strip out the parameters we may have inserted
-		for key, val in params.items() :
-			val = None
-		self.session.params.update(params)
-		
 		# return the successful list of data
-		return resp.json()
+		data = resp.json()
+		self.cache.put(key, data)
+		return data
+	
+	## findingTableIter
+	#
+	# Walk every page of the findings table for the given filter and return the findings
+	# one at a time.  Any 'pagination' in the filter is replaced.  While the caller works
+	# through a page, the next one is already being requested by a background thread, so
+	# no more than two pages are held in memory no matter how many findings there are.
+	#
+	# Paging stops at the first page that comes back short.  The filter should sort on a
+	# stable key (such as 'id') so the pages do not shift between requests.
+	def findingTableIter(self, project_id, filter, params, page_size = None) :
+	
+		if page_size is None :
+			page_size = self.pageSize
+		
+		# a single thread is enough to stay one page ahead of the caller
+		prefetch = concurrent.futures.ThreadPoolExecutor(max_workers = 1)
+		try :
+			page = 1
+			pending = prefetch.submit(self.findingTablePage, project_id, filter, params, page, page_size)
+			while pending is not None :
+				findings = pending.result()
+				
+				# a full page means there may be more.  Start on the next one before
+				# handing this page back
+				pending = None
+				if len(findings) >= page_size :
+					page += 1
+					pending = prefetch.submit(self.findingTablePage, project_id, filter, params, page, page_size)
+				
+				for finding in findings :
+					yield finding
+		finally :
+			# the caller may stop early.  Do not wait on a page nobody will read
+			prefetch.shutdown(wait = False, cancel_futures = True)
+	
+	## findingTablePage
+	#
+	# Collect a single page of the findings table.  The caller's filter is copied so it
+	# may be shared between threads.
+	def findingTablePage(self, project_id, filter, params, page, page_size) :
+		
+		page_filter = dict(filter)
+		page_filter['pagination'] = { 'page' : page, 'perPage' : page_size }
+		return self.findingTableData(project_id, page_filter, params)
 	
 	## getFileLines
 	#
 	# Collect the file information given the project ID, and file ID
 	#
-	# use this as an impromptu cache: self.getFileStorage
-	#								  self.getFileStorageId
+	# Files are spooled to disk by self.sources as they download, keyed by project, file
+	# ID and the project's latest analysis.  A file is only downloaded again once a new
+	# analysis lands, or it has been pushed out of the spool.
 	#
 	def getFileLines(self, project_id, location, count) :
 		
@@ -281,33 +676,37 @@ class CodeDx :
 			return ' '
 
 		# check to see if we already have this file in place.
-		if self.getFileStorageId != location['fileid'] :
-			resp = self.session.get(url)
+		key = self.sources.key(project_id, location['fileid'], self.getLatestAnalysisId(project_id))
+		if not self.sources.has(key) :
+			started = time.perf_counter()
+			resp = self.session.get(url, stream = True)
 			if resp.status_code != 200 :
+				Profiler.request('GET', url, resp.status_code, time.perf_counter() - started, len(resp.content))
 				# print("|-- [CDX getFileLines] responded [" + str(resp.status_code) + "] for file ID [" + str(location['fileid']) + "]")
 				return resp.text
 			
-			# file has been accessed.  Store it in the cache
-			self.getFileStorage = resp.text.split('\n')
-			self.getFileStorageId = location['fileid']
-		
-		# we have the file lines.  Trim them to the lines we need.
-		loc = int(location['line'])
-		count = int(count)
-		lines = self.getFileStorage[loc - count : loc + count]
-		
-		# reformat lines to eliminate the array
-		retval = ''
-		for line in lines :
-			retval += line.rstrip() + '\n'
-		
-		return retval
-		
+			# file has been accessed.  Spool it as it arrives
+			writer = self.sources.writer(key, sourceEncoding(resp.headers.get('Content-Type')))
+			try :
+				for chunk in resp.iter_content(SOURCE_CHUNK) :
+					writer.write(chunk)
+				size = writer.commit()
+			except :
+				writer.discard()
+				raise
+			finally :
+				resp.close()
+			Profiler.request('GET', url, resp.status_code, time.perf_counter() - started, size)
+			
+			with self.fileStatsLock :
+				self.fileStats['files'] += 1
+				self.fileStats['bytes'] += size
 		
+		# we have the file.  Cut out the lines we need.
+		return self.sources.snippet(key, location['line'], count)
 	
-	
-	
-	
-	
-		
-		
\ No newline at end of file
+	## reportFileStats
+	#
+	# Print the number of source files and bytes downloaded during this run
+	def reportFileStats(self) :
+		print("|- Source files fetched = " + str(self.fileStats['files']) + ", bytes = " + str(self.fileStats['bytes']) + ", reused from the spool = " + str(self.sources.reused))
@@ -0,0 +1,359 @@
+## Code Dx Asynchronous Operations Class
+#
+# The asyncio counterpart of the CodeDx class in 'codedx.py'.  It offers the read
+# operations the report needs, as coroutines, so hundreds of STIG queries and file
+# downloads can be in flight on one event loop rather than one thread each.
+#
+# All requests go through a single pooled "aiohttp" session.  A semaphore bounds the
+# number of requests in flight so the Code Dx server is not flooded; the pool is sized
+# to match.  aiohttp is only needed when this class is used, so it is imported here
+# rather than by the rest of the report.
+#
+# Use the class as an async context manager so the session is closed when done:
+#
+#	async with AsyncCodeDx(ini) as cdx :
+#		standards = await cdx.getStandards()
+
+import asyncio
+import email.utils
+import functools
+import json
+import os
+import time
+
+import codedx
+import Profiler
+from ResponseCache import ResponseCache
+from SourceStore import SourceStore
+
+try :
+	import aiohttp
+except ImportError :
+	aiohttp = None
+
+class AsyncCodeDx :
+	## Constructor
+	#
+	# Network parameters are read from the '[CodeDx]' section as for CodeDx.  A response
+	# cache, source spool and the latest analysis IDs may be shared with an existing
+	# CodeDx object, so both clients see the same cached data and statistics.
+	def __init__(self, ini, cache = None, latest_analysis = None, sources = None) :
+
+		if aiohttp is None :
+			print("|-- [Async Code Dx Constructor] ERROR: the aiohttp package is required for async collection")
+			raise ValueError("aiohttp is not installed")
+
+		url = codedx.serverUrl(ini)
+		self.url = url + '/codedx/api'
+		self.urlx = url + '/codedx/x'	# for some experimental API calls
+		self.headers = codedx.apiHeaders(ini)
+		self.limit = ini.getint('CodeDx', 'async_limit', fallback = 32)
+		self.pageSize = ini.getint('CodeDx', 'page_size', fallback = 2500)
+		self.connectTimeout = ini.getfloat('CodeDx', 'connect_timeout', fallback = 10)
+		self.readTimeout = ini.getfloat('CodeDx', 'read_timeout', fallback = 300)
+		self.retries = ini.getint('CodeDx', 'retries', fallback = 3)
+		self.backoff = ini.getfloat('CodeDx', 'retry_backoff', fallback = 0.5)
+		print("|-- [Async Code Dx Constructor] using URL: \"%s\", %d requests in flight" % (self.url, self.limit))
+
+		if cache is None :
+			cache = ResponseCache(ini.get('CodeDx', 'cache_dir', fallback = '.cdxcache'),
+								  ini.getint('CodeDx', 'cache_size_mb', fallback = 256) * 1024 * 1024,
+								  ini.getint('CodeDx', 'cache_max_age', fallback = 3600))
+		self.cache = cache
+		if latest_analysis is None :
+			latest_analysis = {}
+		self.latestAnalysis = latest_analysis
+		if sources is None :
+			sources = SourceStore(ini.get('CodeDx', 'source_dir', fallback = os.path.join(cache.directory, 'sources')),
+								  ini.getint('CodeDx', 'source_cache_mb', fallback = 1024) * 1024 * 1024,
+								  cache.mode)
+		self.sources = sources
+
+		self.fileStats = { 'files' : 0, 'bytes' : 0 }
+		self.standards = None
+		self.session = None
+
+	## Context manager entry
+	#
+	# The session, semaphore and locks belong to the running event loop, so they are
+	# created here rather than in the constructor
+	async def __aenter__(self) :
+		connector = aiohttp.TCPConnector(limit = self.limit)
+		timeout = aiohttp.ClientTimeout(sock_connect = self.connectTimeout, sock_read = self.readTimeout)
+		self.session = aiohttp.ClientSession(headers = self.headers, connector = connector, timeout = timeout)
+		self.semaphore = asyncio.Semaphore(self.limit)
+		self.latestAnalysisLock = asyncio.Lock()
+		self.standardsLock = asyncio.Lock()
+		return self
+
+	async def __aexit__(self, exc_type, exc, tb) :
+		await self.session.close()
+		self.session = None
+
+	## blocking
+	#
+	# Run a blocking call - the disk I/O of the response cache and the source spool - on
+	# the loop's default thread pool, so the other requests carry on meanwhile
+	async def blocking(self, function, *args, **kwargs) :
+		return await asyncio.get_running_loop().run_in_executor(None, functools.partial(function, *args, **kwargs))
+
+	## retryWait
+	#
+	# The seconds to wait before sending a request again after a busy (429 or 503)
+	# response, as the retry policy of CodeDx: the server's Retry-After when it gives one,
+	# otherwise retry_backoff, doubling each try.  None when the response is not retried.
+	def retryWait(self, resp, attempt) :
+		if not resp.status in codedx.BUSY_STATUSES or attempt >= self.retries :
+			return None
+		after = resp.headers.get('Retry-After')
+		if after is not None :
+			try :
+				return max(0.0, float(after))
+			except ValueError :
+				pass
+			try :
+				return max(0.0, email.utils.parsedate_to_datetime(after).timestamp() - time.time())
+			except (TypeError, ValueError) :
+				pass
+		return self.backoff * (2 ** attempt)
+
+	## request
+	#
+	# Send one request while holding the semaphore.  Returns the status and the body,
+	# decoded as JSON unless 'text' is set.  The number of bytes is returned as well for
+	# the transfer statistics.  Busy responses are retried (see retryWait); the wait
+	# keeps the semaphore, so a throttled client also sends less.
+	async def request(self, method, url, params = None, body = None, text = False) :
+		data = None
+		headers = None
+		if body is not None :
+			data = json.dumps(body)
+			headers = { 'Content-Type' : 'application/json' }
+
+		async with self.semaphore :
+			for attempt in range(self.retries + 1) :
+				started = time.perf_counter()
+				async with self.session.request(method, url, params = params, data = data, headers = headers) as resp :
+					raw = await resp.read()
+				Profiler.request(method, url, resp.status, time.perf_counter() - started, len(raw))
+				wait = self.retryWait(resp, attempt)
+				if wait is None :
+					break
+				await asyncio.sleep(wait)
+
+		if resp.status != 200 or text :
+			return resp.status, raw.decode('utf-8', errors = 'replace'), len(raw)
+		return resp.status, json.loads(raw), len(raw)
+
+	## getProjectIds
+	#
+	# Collect the project list and return a dictionary of project name to ID
+	async def getProjectIds(self) :
+		key = self.cache.key('projects')
+		data = await self.blocking(self.cache.get, key, max_age = True)
+		if data is None :
+			status, data, size = await self.request('GET', self.url + '/projects')
+			if status != 200 :
+				print("|-- [ACDX getProjectIds] get projects responded [%d]" % status)
+				return {}
+			await self.blocking(self.cache.put, key, data)
+
+		return { project['name'] : project['id'] for project in data['projects'] }
+
+	## getLatestAnalysisId
+	#
+	# Return the ID of the project's most recent analysis, or None if it is unknown
+	async def getLatestAnalysisId(self, project_id) :
+		async with self.latestAnalysisLock :
+			if project_id in self.latestAnalysis :
+				return self.latestAnalysis[project_id]
+
+			analysis_id = None
+			status, data, size = await self.request('GET', self.url + '/projects/' + str(project_id) + '/analyses')
+			if status == 200 :
+				ids = [ analysis['id'] for analysis in data ]
+				if len(ids) > 0 :
+					analysis_id = max(ids)
+			else :
+				print("|-- [ACDX getLatestAnalysisId] responded [%d], project responses will not be cached" % status)
+
+			self.latestAnalysis[project_id] = analysis_id
+			return analysis_id
+
+	## projectCacheKey
+	#
+	# Form the cache key for a project query, as CodeDx.projectCacheKey
+	async def projectCacheKey(self, endpoint, project_id, body) :
+		if self.cache.mode == 'off' :
+			return None
+
+		analysis_id = await self.getLatestAnalysisId(project_id)
+		if analysis_id is None :
+			return None
+		return self.cache.key(endpoint, project_id, body, analysis_id)
+
+	## getStandards
+	#
+	# Collect the standards available on this server.  As with CodeDx.getStandards they
+	# are only collected once.
+	async def getStandards(self) :
+		async with self.standardsLock :
+			if self.standards is not None :
+				return self.standards
+
+			key = self.cache.key('standards/filter-views')
+			data = await self.blocking(self.cache.get, key, max_age = True)
+			if data is not None :
+				self.standards = data
+				return data
+
+			status, data, size = await self.request('GET', self.url + '/standards/filter-views')
+			if status != 200 :
+				print("|-- [ACDX getStandards] responded [%d]" % status)
+				return []
+
+			await self.blocking(self.cache.put, key, data)
+			self.standards = data
+			return data
+
+	## findingsGroupedCount
+	#
+	# Collect findings by groups
+	async def findingsGroupedCount(self, project_id, filter) :
+		key = await self.projectCacheKey('findings/grouped-counts', project_id, filter)
+		data = await self.blocking(self.cache.get, key)
+		if data is not None :
+			return data
+
+		url = self.url + '/projects/' + str(project_id) + '/findings/grouped-counts'
+		status, data, size = await self.request('POST', url, body = filter)
+		if status != 200 :
+			print("|-- [ACDX findingsGroupedCount] responded [%d]" % status)
+			return []
+
+		await self.blocking(self.cache.put, key, data)
+		return data
+
+	## getCodeMetrics
+	#
+	# Collect the code metrics part of the dashboard for the most recent day
+	async def getCodeMetrics(self, project_id) :
+		body = { "codeMetrics" : { "latest" : '1' }}
+		key = await self.projectCacheKey('dashboard', project_id, body)
+		data = await self.blocking(self.cache.get, key)
+		if data is not None :
+			return data
+
+		url = self.urlx + '/dashboard/' + str(project_id)
+		status, data, size = await self.request('POST', url, params = { 'includeChildProjects' : 'true' }, body = body)
+		if status != 200 :
+			print("|-- [ACDX getCodeMetrics] responded [%d]" % status)
+			return []
+
+		data = data['codeMetrics']
+		await self.blocking(self.cache.put, key, data)
+		return data
+
+	## findingTableData
+	#
+	# Collect the findings for the given filter and parameters
+	async def findingTableData(self, project_id, filter, params) :
+		key = await self.projectCacheKey('findings/table', project_id, [ filter, params ])
+		data = await self.blocking(self.cache.get, key)
+		if data is not None :
+			return data
+
+		url = self.url + '/projects/' + str(project_id) + '/findings/table'
+		status, data, size = await self.request('POST', url, params = params, body = filter)
+		if status != 200 :
+			print("|-- [ACDX findingTableData] responded [%d]" % status)
+			return []
+
+		await self.blocking(self.cache.put, key, data)
+		return data
+
+	## findingTableIter
+	#
+	# Walk every page of the findings table, yielding one finding at a time.  As with
+	# CodeDx.findingTableIter the next page is requested while the current one is
+	# being consumed.
+	async def findingTableIter(self, project_id, filter, params, page_size = None) :
+		if page_size is None :
+			page_size = self.pageSize
+
+		page = 1
+		pending = asyncio.ensure_future(self.findingTablePage(project_id, filter, params, page, page_size))
+		try :
+			while pending is not None :
+				findings = await pending
+				pending = None
+				if len(findings) >= page_size :
+					page += 1
+					pending = asyncio.ensure_future(self.findingTablePage(project_id, filter, params, page, page_size))
+
+				for finding in findings :
+					yield finding
+		finally :
+			if pending is not None :
+				pending.cancel()
+
+	## findingTablePage
+	#
+	# Collect a single page of the findings table
+	async def findingTablePage(self, project_id, filter, params, page, page_size) :
+		page_filter = dict(filter)
+		page_filter['pagination'] = { 'page' : page, 'perPage' : page_size }
+		return await self.findingTableData(project_id, page_filter, params)
+
+	## getSource
+	#
+	# Make sure a source file is in the spool, downloading it if needed.  Returns its
+	# key in self.sources for the snippets, or None if the server refused.  Busy responses
+	# are retried as in 'request'.
+	async def getSource(self, project_id, fileid) :
+		key = self.sources.key(project_id, fileid, await self.getLatestAnalysisId(project_id))
+		if await self.blocking(self.sources.has, key) :
+			return key
+
+		url = self.url + '/projects/' + str(project_id) + '/files/' + str(fileid)
+		async with self.semaphore :
+			for attempt in range(self.retries + 1) :
+				started = time.perf_counter()
+				async with self.session.get(url) as resp :
+					if resp.status == 200 :
+						writer = await self.blocking(self.sources.writer, key, codedx.sourceEncoding(resp.headers.get('Content-Type')))
+						try :
+							async for chunk in resp.content.iter_chunked(codedx.SOURCE_CHUNK) :
+								await self.blocking(writer.write, chunk)
+							size = await self.blocking(writer.commit)
+						except :
+							await self.blocking(writer.discard)
+							raise
+						break
+					raw = await resp.read()
+				Profiler.request('GET', url, resp.status, time.perf_counter() - started, len(raw))
+				wait = self.retryWait(resp, attempt)
+				if wait is None :
+					return None
+				await asyncio.sleep(wait)
+			Profiler.request('GET', url, resp.status, time.perf_counter() - started, size)
+
+		self.fileStats['files'] += 1
+		self.fileStats['bytes'] += size
+		return key
+
+	## queryJobStatus
+	#
+	# Return the status of the jobId
+	async def queryJobStatus(self, jobId) :
+		status, data, size = await self.request('GET', self.url + '/jobs/' + str(jobId))
+		if status != 200 :
+			print("|-- [ACDX queryJobStatus] queryJobStatus responded [%d]" % status)
+			raise ValueError("CDX jobId invalid for unknown reasons")
+		return data['status']
+
+	## reportFileStats
+	#
+	# Print the number of source files and bytes downloaded during this run
+	def reportFileStats(self) :
+		print("|- Source files fetched = " + str(self.fileStats['files']) + ", bytes = " + str(self.fileStats['bytes']) + ", reused from the spool = " + str(self.sources.reused))
@@ -6,12 +6,21 @@ import argparse
 import codedx
 import ExecutiveSummary as es
 import ReportLanguage as rl
+import ReportStatistics as rs
 import FindingsAndTools
 import FindingDetails as fd
 import ToolUtilities
+import TemplateCompiler
+import FopRenderer
+import Profiler
+import SummarySnapshot
+import ExportIngest
 import xml.etree.ElementTree as ET
 import datetime
 import re
+import os
+import fnmatch
+import concurrent.futures
 
 ## Table of Contents DISA STIG Version
 #
@@ -55,6 +64,25 @@ def projectName(parms) :
 	elem.text = 'Project Name: ' + parms['project']
 	
 
+## executiveChart
+#
+# Place the chart of findings by CAT: the SVG chart itself, or a link to the picture
+# file drawn by matplotlib
+def executiveChart(parms) :
+	parent = parms['parent']
+	parent.remove(parms['child'])
+	
+	if parms['chart'] is not None :
+		elem = ET.SubElement(parent, 'fo:instream-foreign-object')
+		elem.attrib['content-width'] = "75%"
+		elem.attrib['content-height'] = "75%"
+		elem.append(parms['chart'])
+	else :
+		elem = ET.SubElement(parent, 'fo:external-graphic')
+		elem.attrib['content-width'] = "75%"
+		elem.attrib['content-height'] = "75%"
+		elem.attrib['src'] = parms['chart_src']
+
 ## disaStigVersion
 #
 # Add records for the version of DISA ASD STIG we are using
@@ -265,19 +293,107 @@ def tocDetails(parms) :
 		link = ET.SubElement(bl, 'fo:basic-link', { 'internal-destination' : key })
 		ET.SubElement(link, 'fo:page-number-citation', { 'ref-id' : key })
 	
-## Main Entry Point
+## writeFo
 #
-def main(args) :
+# Write the finished template to the FO file.  Sections that were left as placeholder
+# comments (see 'streams' in main) are written in place of their comment, straight to
+# the file, so they are never held in memory as a whole.  The file is otherwise the
+# same as ElementTree would write.
+def writeFo(tree, filename, streams) :
+
+	if len(streams) == 0 :
+		tree.write(filename, xml_declaration=True, encoding='utf-8', method='xml')
+		return
 	
-	# begin by grabbing our configuration, and parse it
-	print(":----------")
-	print("|- reading configuration")
-	ini = configparser.ConfigParser()
-	ini.read(args.config)
+	# the template, without the streamed sections, is small enough to serialize whole
+	text = ET.tostring(tree.getroot(), encoding='unicode')
 	
-	# create a Code Dx object
-	cdx = codedx.CodeDx(ini)
-	project_name = ini.get('CodeDx', 'project')
+	# fill in the placeholders in the order they appear in the document
+	placed = [ ( text.index('<!--' + marker + '-->'), marker, write ) for marker, write in streams ]
+	placed.sort()
+	
+	with open(filename, 'w', encoding='utf-8', errors='xmlcharrefreplace') as out :
+		out.write("<?xml version='1.0' encoding='utf-8'?>\n")
+		start = 0
+		for position, marker, write in placed :
+			out.write(text[start : position])
+			write(out)
+			start = position + len('<!--' + marker + '-->')
+		out.write(text[start :])
+
+## profiledStream
+#
+# Count the time a streamed section takes to write against the handler that added it
+def profiledStream(content, write) :
+	def timed(out) :
+		with Profiler.phase(content, category = 'handler', streamed = True) :
+			write(out)
+	return timed
+
+## projectPaths
+#
+# The output files for a project, and the snapshot to save (--save-snapshot), if any.  A
+# single report uses the configured names.  In a batch
+# each name gets the project name added (example/report.fo becomes
+# example/report-MyProject.fo), so the reports do not overwrite each other.
+def projectPaths(ini, project_name, pdf, batch, snapshot = '') :
+
+	paths = { 'fo_output'        : ini.get('Report', 'fo_output'),
+			  'graphic_filename' : ini.get('Report', 'graphic_filename'),
+			  'pdf_output'       : ini.get('Report', 'pdf_output', fallback = ''),
+			  'snapshot'         : snapshot or '' }
+	if pdf and paths['pdf_output'] == '' :
+		paths['pdf_output'] = os.path.splitext(paths['fo_output'])[0] + '.pdf'
+	
+	if batch :
+		suffix = '-' + re.sub('[^A-Za-z0-9._-]', '_', project_name)
+		for key, path in paths.items() :
+			if path != '' :
+				root, ext = os.path.splitext(path)
+				paths[key] = root + suffix + ext
+	return paths
+
+## relinkGraphic
+#
+# Templates written before the ExecutiveChart placeholder link the chart picture by its
+# path from the FO file (graphics/DisaStigChart.png for the shipped configuration).  When
+# a project's chart has a name of its own, point the link at it instead.
+def relinkGraphic(tree, ini, paths) :
+
+	configured = os.path.relpath(ini.get('Report', 'graphic_filename'), os.path.dirname(os.path.abspath(ini.get('Report', 'fo_output'))))
+	project = os.path.relpath(paths['graphic_filename'], os.path.dirname(os.path.abspath(paths['fo_output'])))
+	if configured == project :
+		return
+	for graphic in tree.iter('{http://www.w3.org/1999/XSL/Format}external-graphic') :
+		if graphic.get('src') == configured :
+			graphic.set('src', project)
+
+## selectProjects
+#
+# Resolve a batch selection against the server's projects.  The selection is a comma
+# separated list of project names or glob patterns ('web-*'), or 'all'.
+def selectProjects(selection, project_ids) :
+
+	selected = []
+	for pattern in [ item.strip() for item in selection.split(',') ] :
+		if pattern == '' :
+			continue
+		if pattern == 'all' :
+			matches = list(project_ids.keys())
+		else :
+			matches = fnmatch.filter(project_ids.keys(), pattern)
+		if len(matches) == 0 :
+			print("|- WARNING: no project matches \"" + pattern + "\"")
+		for name in matches :
+			if not name in selected :
+				selected.append(name)
+	return selected
+
+## Report one project
+#
+# Collect the data for a project and write its report to 'paths' (see projectPaths)
+def reportProject(ini, cdx, project_name, paths, cache_mode) :
+
 	project_id = cdx.projectIds[project_name]
 	print("|- Project " + project_name + " has ID", project_id)
 	
@@ -292,11 +408,44 @@ def main(args) :
 	# decided to do it the easy way.
 	#summary_data, stig_counts = es.CollectExecutiveSummary(ini, cdx, project_id)
 	
-	# perform the queries to generate additional data for findings, and tools
-	summary_data = FindingsAndTools.get(ini, cdx, project_id, ini.get('Report', 'code_detail'))
+	# When streaming, the finding details are formatted while the findings are still
+	# being collected (when the collection is pipelined).  They wait in a spool until
+	# the FO file is written
+	spool = None
+	if ini.getboolean('Report', 'fo_streaming', fallback = True) :
+		spool = fd.DetailSpool(ini.getint('Report', 'render_workers', fallback = 1))
 	
-	# now that we have the data, form up the graphics
-	es.FormatExecutiveGraphic(summary_data, ini.get('Report', 'graphic_filename'))
+	# the spool's temporary file and waiting fragments are let go however the report ends
+	try :
+		# perform the queries to generate additional data for findings, and tools
+		with Profiler.phase('collect', project = project_name) :
+			summary_data = FindingsAndTools.get(ini, cdx, project_id, ini.get('Report', 'code_detail'),
+												spool.add if spool is not None else None)
+		if spool is not None and not summary_data['pipelined'] :
+			spool.close()
+			spool = None
+		
+		# keep the data for writing the report again without the server (--from-snapshot)
+		if paths['snapshot'] != '' :
+			SummarySnapshot.save(paths['snapshot'], project_name, project_id, summary_data)
+		
+		writeReport(ini, cdx, project_name, project_id, summary_data, paths, cache_mode, spool)
+	finally :
+		if spool is not None :
+			spool.close()
+
+## Write a report
+#
+# Write the report for the collected 'summary_data' of a project.  'cdx' is None when the
+# data comes from a snapshot.  'spool' holds the finding details when they were formatted
+# during collection.
+def writeReport(ini, cdx, project_name, project_id, summary_data, paths, cache_mode, spool = None) :
+	
+	# now that we have the data, form up the graphics.  The picture file is found from
+	# the directory of the FO file
+	with Profiler.phase('chart', project = project_name) :
+		chart = es.FormatExecutiveGraphic(summary_data, paths['graphic_filename'], ini.get('Report', 'chart_backend', fallback = 'svg'))
+	chart_src = os.path.relpath(paths['graphic_filename'], os.path.dirname(os.path.abspath(paths['fo_output'])))
 	
 	# This is a call table used to collect the CodeDx elements "content" attribute into.
 	# When the attribute is determined, a subroutine is called to create the appropriate
@@ -305,6 +454,7 @@ def main(args) :
 					   'ReportDate'          : reportDate,
 					   'ProjectName'         : projectName,
 					   'DisaStigVersion'     : disaStigVersion,
+					   'ExecutiveChart'      : executiveChart,
 					   'CatCells'            : catCells,
 					   'FindingCountsByStig' : findingCountsByStig,
 					   'CatIStigCounts'      : cat1StigCounts,
@@ -314,6 +464,10 @@ def main(args) :
 					   'ToolFindings'        : toolFindings,
 					   'ToolTotalFindings'   : toolTotalFindings,
 					   'ToCDetails'          : tocDetails,
+					   'ToolCatMatrix'       : rs.toolCatCells,
+					   'FileDensity'         : rs.fileDensityCells,
+					   'ToolOverlap'         : rs.toolOverlapTable,
+					   'StigToolCoverage'    : rs.stigToolCoverageCells,
 					   'FormatFindingDetail' : fd.details
 					 }
 	
@@ -324,42 +478,159 @@ def main(args) :
 	# load up the "fo:" namespace before loading in the template.  This prevents the tags
 	# from being rewritten to "ns0"
 	ET.register_namespace('fo', "http://www.w3.org/1999/XSL/Format")
-	tree = ET.parse(template_file)
-	root = tree.getroot()
 	
-	# Now it is successfully loaded into memory.  This is a little weird... we cannot get
-	# the parent of a node.  So we have to get the parents (using XPath ".//CodeDx/..") and
-	# search for the element we need to replace... the CodeDx element.  But now we have
-	# the parent
+	# The template is compiled once and cached beside the responses.  Compiling records
+	# each CodeDx element along with its parent (ElementTree cannot find the parent of a
+	# node), so we get a fresh copy of the template with its slots ready to fill
+	template_cache = ini.get('CodeDx', 'cache_dir', fallback = '.cdxcache')
+	if cache_mode == 'off' :
+		template_cache = None
+	with Profiler.phase('template', project = project_name) :
+		tree, slots = TemplateCompiler.load(template_file, template_cache).instantiate()
+	relinkGraphic(tree, ini, paths)
 	print("|- Loaded report template")
-	code_dx_parent_tags = root.findall(".//CodeDx/..")
 
 	# A consistent call format is used.  The input dictionary is call specific and 
 	# contains elements that are required.
 	call_dict = { 'project'   : project_name,
 				  'summary'   : summary_data,
 				  'cdx'       : cdx,
-				  'proj_id'   : project_id
+				  'proj_id'   : project_id,
+				  'chart'     : chart,
+				  'chart_src' : chart_src
 				}
 	
-	# look at each of the parents and find the "CodeDx" tag we need to replace
-	for parent_code_dx in code_dx_parent_tags :
-		
-		# save the parent for our call in our generic parameters list
-		call_dict['parent'] = parent_code_dx
-		
-		# find all of the CodeDx elements and return them
-		code_dx_list = parent_code_dx.findall(".//CodeDx")
-		
-		for code_dx in code_dx_list :
+	# When streaming, large sections (the finding details) are not built into the tree.
+	# Their handlers leave a placeholder comment, and add the comment text and a writer
+	# function to 'streams' for writeFo.
+	streams = []
+	if ini.getboolean('Report', 'fo_streaming', fallback = True) :
+		call_dict['streams'] = streams
+		call_dict['render_workers'] = ini.getint('Report', 'render_workers', fallback = 1)
+		call_dict['details_spool'] = spool
+	elif ini.getint('Report', 'render_workers', fallback = 1) > 1 :
+		print("|- render_workers needs fo_streaming; the details are formatted in this process")
+	
+	# fill each slot: the parent and the "CodeDx" tag we need to replace.  The time each
+	# handler takes is profiled, including any section it streams later
+	with Profiler.phase('fill', project = project_name) :
+		for parent_code_dx, code_dx, content in slots :
+			
+			# save the parent and child for our call in our generic parameters list, then
 			# call the appropriate routine from our CodeDxContents subroutine to generate
 			# the records we need directly into the parent XML
+			call_dict['parent'] = parent_code_dx
 			call_dict['child'] = code_dx
-			CodeDxContents[code_dx.attrib['content']](call_dict)
+			streamed = len(streams)
+			with Profiler.phase(content, category = 'handler') :
+				CodeDxContents[content](call_dict)
+			for index in range(streamed, len(streams)) :
+				marker, write = streams[index]
+				streams[index] = ( marker, profiledStream(content, write) )
 	
 	# write the resultant XML file into our output
-	tree.write(ini.get('Report', 'fo_output'), xml_declaration=True, encoding='utf-8', method='xml')
-	print("|- Writing output FO file \"" + ini.get('Report', 'fo_output') + "\"")
+	with Profiler.phase('write', project = project_name) :
+		writeFo(tree, paths['fo_output'], streams)
+	if spool is not None :
+		spool.close()
+	print("|- Writing output FO file \"" + paths['fo_output'] + "\"")
+	
+	# render the PDF through the long lived FOP worker when asked to.  The FO file is
+	# kept for review
+	if paths['pdf_output'] != '' :
+		print("|- Rendering PDF file \"" + paths['pdf_output'] + "\"")
+		with Profiler.phase('pdf', project = project_name) :
+			FopRenderer.shared(ini).render(paths['fo_output'], paths['pdf_output'])
+
+## Main Entry Point
+#
+# One report for the configured 'project', or with a project selection ('--projects' or
+# 'projects' in '[CodeDx]') a batch of reports.  A batch shares one Code Dx client, its
+# caches and the compiled template, and runs 'batch_workers' reports at once.  A project
+# that fails is reported at the end; the others carry on.
+def main(args) :
+	
+	# begin by grabbing our configuration, and parse it
+	print(":----------")
+	print("|- reading configuration")
+	ini = configparser.ConfigParser()
+	ini.read(args.config)
+	
+	# with --profile every phase is timed, and the profile written even if the run fails
+	profile = None
+	if args.profile :
+		profile = Profiler.start()
+	
+	try :
+		# create a Code Dx object.  The response cache may be bypassed from the command line
+		cache_mode = 'use'
+		if args.refresh :
+			cache_mode = 'refresh'
+		if args.no_cache :
+			cache_mode = 'off'
+		
+		# a report from a snapshot (--from-snapshot) needs no server
+		if args.from_snapshot :
+			header, summary_data = SummarySnapshot.load(args.from_snapshot)
+			project_name = header['project']
+			writeReport(ini, None, project_name, header['project_id'], summary_data,
+						projectPaths(ini, project_name, args.pdf, False), cache_mode)
+			return
+		
+		# so does a report from a Code Dx report export (--from-export).  The export is
+		# checked first, and a run with an export it cannot use fails rather than writing
+		# no report.  The data read may be saved as a snapshot like any other
+		if args.from_export :
+			problem = ExportIngest.check(ini, args.from_export)
+			if problem is not None :
+				print("|- ERROR: " + problem)
+				raise SystemExit(1)
+			project_name = ini.get('CodeDx', 'project', fallback = os.path.splitext(os.path.basename(args.from_export))[0])
+			with Profiler.phase('collect', project = project_name) :
+				summary_data = ExportIngest.load(ini, args.from_export)
+			paths = projectPaths(ini, project_name, args.pdf, False, args.save_snapshot)
+			if paths['snapshot'] != '' :
+				SummarySnapshot.save(paths['snapshot'], project_name, None, summary_data)
+			writeReport(ini, None, project_name, None, summary_data, paths, cache_mode)
+			return
+		
+		with Profiler.phase('connect') :
+			cdx = codedx.CodeDx(ini, cache_mode)
+	
+		selection = args.projects or ini.get('CodeDx', 'projects', fallback = '')
+		failed = []
+		if selection == '' :
+			project_name = ini.get('CodeDx', 'project')
+			reportProject(ini, cdx, project_name, projectPaths(ini, project_name, args.pdf, False, args.save_snapshot), cache_mode)
+		else :
+			projects = selectProjects(selection, cdx.projectIds)
+			workers = ini.getint('Report', 'batch_workers', fallback = 2)
+			print("|- Batch of " + str(len(projects)) + " projects, " + str(workers) + " at a time")
+		
+			with concurrent.futures.ThreadPoolExecutor(max_workers = workers) as pool :
+				futures = {}
+				for project_name in projects :
+					paths = projectPaths(ini, project_name, args.pdf, True, args.save_snapshot)
+					futures[pool.submit(reportProject, ini, cdx, project_name, paths, cache_mode)] = project_name
+			
+				for future in concurrent.futures.as_completed(futures) :
+					try :
+						future.result()
+					except Exception as e :
+						print("|- ERROR: project " + futures[future] + " failed: " + repr(e))
+						failed.append(futures[future])
+		
+			print("|- Batch done: " + str(len(projects) - len(failed)) + " reports written, " + str(len(failed)) + " failed")
+			for project_name in failed :
+				print("|-- failed: " + project_name)
+	
+		# let the user know how much the response cache saved, and drop a temporary spool
+		cdx.cache.report()
+		cdx.sources.close()
+	finally :
+		if profile is not None :
+			summary_file, trace_file = profile.write(args.profile)
+			print("|- Profile written to \"" + summary_file + "\" and \"" + trace_file + "\"")
 
 	
 ## Environment Entry Point
@@ -367,9 +638,19 @@ def main(args) :
 desc = 'Collect information to generate customer specialized report.\n'
 parser = argparse.ArgumentParser(description=desc)
 parser.add_argument("--config",   "-c", required=True, help="Input configuration file")
-args = parser.parse_args()
+parser.add_argument("--no-cache", action="store_true", help="Do not read or write the response cache or source spool")
+parser.add_argument("--refresh",  action="store_true", help="Ignore cached responses and sources, but store the new ones")
+parser.add_argument("--pdf",      action="store_true", help="Also render the PDF (to pdf_output, or next to the FO file)")
+parser.add_argument("--profile",  nargs="?", const="profile", help="Time the run; writes PROFILE.json and the trace PROFILE.trace.json (default 'profile')")
+parser.add_argument("--save-snapshot", metavar="FILE", help="Save the collected data to FILE, to write the report again with --from-snapshot")
+parser.add_argument("--from-snapshot", metavar="FILE", help="Write the report from a saved snapshot, without the Code Dx server")
+parser.add_argument("--from-export", metavar="FILE", help="Write the report from a Code Dx CSV or XML report export, without the Code Dx server")
+parser.add_argument("--projects", help="Report a batch of projects: comma separated names or patterns, or 'all'")
 
+# the arguments are only parsed when run as a program, so 'main' may also be driven by
+# other tools (see bench/benchmark.py) with their own argument namespace
 if __name__ == "__main__" :
+	args = parser.parse_args()
 	try :
 		main(args)
 	except ValueError as e :